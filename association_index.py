@@ -10,6 +10,7 @@ import operator
 import random
 import statistics
 import argparse
+import checkpoint
 
 def calculateAssociationIndex(phylogeny): #This function takes a phylogeny and calculates the association index of the discrete character at the phylogeny tips
     associationIndex = 0.0 #Will be increased with each internal node that is analysed
@@ -31,6 +32,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument("-t", help = "File path to newick phylogenetic tree with the trait of interest after the last _ in each tip")
     parser.add_argument("-b", help = "Number of bootstraps, default 1000", default="1000")
+    checkpoint.addCheckpointArguments(parser)
     args = parser.parse_args()
 
     phylogeny = p.read(args.t,"newick") #Import the newick phylogeny
@@ -42,12 +44,22 @@ if __name__ == "__main__":
 
     bootstrapAssociationIndex = [] #Will be filled with the association index for each bootstrap run
 
-    for bootstrap in range(int(args.b)): #Iterate through the bootstrap replicates
+    if args.checkpoint: #Continue from the bootstraps completed before the script was stopped, if there are any
+        runCheckpoint = checkpoint.Checkpoint(args, [args.t])
+        resume = runCheckpoint.read()
+        if resume:
+            bootstrapAssociationIndex = resume["bootstraps"]
+            random.setstate(resume["random_state"]) #Continue the same sequence of random numbers as an uninterrupted run
+            print("Resuming from " + args.checkpoint + " after " + str(len(bootstrapAssociationIndex)) + " bootstraps")
+
+    for bootstrap in range(len(bootstrapAssociationIndex), int(args.b)): #Iterate through the remaining bootstrap replicates
         bootstrapSample = random.sample(phylogenyTipTrait,len(phylogenyTipTrait)) #Randomly sample the traits without replacement
         bootstrapPhylogeny = phylogeny
         for i,phylogenyTip in enumerate(bootstrapPhylogeny.get_terminals()): #Iterate through the tips in the bootstrap phylogeny
             phylogenyTip.name = "_" + bootstrapSample[i] #Assign the tip to the ith trait
         bootstrapAssociationIndex.append(calculateAssociationIndex(bootstrapPhylogeny))
+        if args.checkpoint and runCheckpoint.due(): #Save the completed bootstraps and the state of the random number generator
+            runCheckpoint.write({"bootstraps": bootstrapAssociationIndex, "random_state": random.getstate()})
     
     numberBootstraps = 0 #Will be increased if the bootstrap has a stronger association index than the real data
     for bootstrapIndex in bootstrapAssociationIndex: #Iterate through the bootstrap association indices
@@ -56,3 +68,6 @@ if __name__ == "__main__":
     proportionBootstraps = float(numberBootstraps)/float(args.b) #Calculate the proportion of bootstraps with an association index as strong as the real data
 
     print("Association Index of the phylogeny = " + str(phylogenyAssociationIndex) + "\nMedian bootstrap Association Index = " + str(statistics.median(bootstrapAssociationIndex)) + "\nP-value on the association = " + str(proportionBootstraps))
+
+    if args.checkpoint:
+        runCheckpoint.remove()
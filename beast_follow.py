@@ -0,0 +1,160 @@
+#Follows the .trees and .log files of a running BEAST analysis
+#Only complete lines are read, so a tree or log line that BEAST is part way through writing is not used until it is finished
+#Each tree is paired with the log line with the same MCMC state once both have been written
+#Following stops when the trees file is closed with End; and every tree has been paired, or when interrupted with Ctrl-C
+#Once the trees file has ended, trees still waiting for a log line when a later poll finds nothing new in the log are counted as missing
+
+import os
+import time
+import tempfile
+
+import beast_pairs
+
+#Reads complete lines that have been appended to a file since the last read
+class FollowFile:
+    def __init__(self, fileName):
+        self.fileObject = open(fileName)
+        #Part of a line that has not yet been completely written
+        self.partial = ""
+
+    #Returns a list of the complete lines written since the last call
+    def readLines(self):
+        data = self.fileObject.read()
+        if not data:
+            return([])
+
+        lines = (self.partial + data).splitlines(True)
+        if lines[-1][-1] != "\n":
+            self.partial = lines.pop()
+        else:
+            self.partial = ""
+
+        return(lines)
+
+    def close(self):
+        self.fileObject.close()
+
+#Pairs trees and log lines from a running BEAST analysis as they are written
+class BEASTFollower:
+    def __init__(self, treesFile, logFile, pollInterval = 1.0):
+        self.trees = FollowFile(treesFile)
+        self.log = FollowFile(logFile)
+        self.pollInterval = pollInterval
+
+        #Trees and log lines that have been read but not yet paired, and the number of trees without a log line
+        self.report = beast_pairs.createReport()
+        self.join = beast_pairs.StateJoin(self.report)
+        self.header = None
+        #Lines of the trees file before the first tree, e.g. the taxa and Translate blocks
+        self.treesHeader = []
+        #The header of the trees file also contains End; lines so the end is only looked for after the first tree
+        self.treesStarted = False
+        #Set to True once the End; line after the trees has been read
+        self.treesFinished = False
+        #True if the latest update read new lines from the log file
+        self.logUpdated = False
+
+    #Reads new lines from both files, returns True if anything new was read
+    def update(self):
+        newTrees = self.trees.readLines()
+        for line in newTrees:
+            if line[0:4] == "tree":
+                self.join.addTree(line)
+                self.treesStarted = True
+            elif not self.treesStarted:
+                self.treesHeader.append(line)
+            elif line.strip().lower() == "end;":
+                self.treesFinished = True
+
+        newLog = self.log.readLines()
+        for line in newLog:
+            #Skip comments and the end of the log file, as in removeHeader
+            if (line[0] != "#") and (line != "End;\n") and (line != "end;\n"):
+                if self.header is None:
+                    self.header = line
+                else:
+                    self.join.addLog(line)
+
+        self.logUpdated = bool(newLog)
+
+        return(bool(newTrees) or bool(newLog))
+
+    #Returns the column header line of the log file, waiting until it has been written
+    def readLogHeader(self):
+        while self.header is None:
+            if not self.update():
+                time.sleep(self.pollInterval)
+
+        return(self.header)
+
+    #Returns the lines of the trees file before the first tree, waiting until the first tree has been written
+    def readTreesHeader(self):
+        while not self.treesStarted:
+            if not self.update():
+                time.sleep(self.pollInterval)
+
+        return(self.treesHeader)
+
+    #Yields (tree line, log line, position of the log line) as they become available
+    #None is yielded whenever there is nothing new to analyse so the caller can carry out periodic work, such as writing a summary
+    def pairs(self):
+        #Set to True once the trees file has ended and a poll interval has passed without anything to pair, so the log has been given
+        #time to finish being written
+        waited = False
+
+        while True:
+            self.update()
+
+            #Pair the trees whose log lines have been written
+            pairs = self.join.getPairs()
+
+            #Trees still waiting once the trees file has ended and the log has stopped growing, e.g. trees with states after the last
+            #log line, will not be paired and are counted as missing
+            if waited and self.join.trees and not self.logUpdated:
+                pairs += self.join.flush()
+
+            for pair in pairs:
+                yield(pair)
+
+            #The analysis is complete once the trees file has ended and every tree has been paired
+            if self.treesFinished and not self.join.trees:
+                break
+
+            if not pairs:
+                yield(None)
+                time.sleep(self.pollInterval)
+                waited = self.treesFinished
+            else:
+                waited = False
+
+    def close(self):
+        self.trees.close()
+        self.log.close()
+
+#Returns True once every given number of seconds
+class IntervalTimer:
+    def __init__(self, interval):
+        self.interval = float(interval)
+        self.last = time.monotonic()
+
+    def due(self):
+        if time.monotonic() - self.last >= self.interval:
+            self.last = time.monotonic()
+            return(True)
+
+        return(False)
+
+#Writes text, or bytes, to a file by writing a temporary file in the same directory and renaming it over the original
+#Anything reading the file sees either the previous or the new contents, never a partially written file
+def writeAtomic(fileName, text):
+    directory = os.path.dirname(os.path.abspath(fileName))
+    tmpHandle, tmpName = tempfile.mkstemp(dir = directory, prefix = "." + os.path.basename(fileName) + ".")
+
+    try:
+        with os.fdopen(tmpHandle, "wb" if isinstance(text, bytes) else "w") as tmpFile:
+            tmpFile.write(text)
+        os.replace(tmpName, fileName)
+    except BaseException:
+        if os.path.exists(tmpName):
+            os.remove(tmpName)
+        raise
@@ -0,0 +1,124 @@
+#Pairs the trees in a BEAST .trees file with the lines of the corresponding .log file using their MCMC states
+#The log file is indexed by its first column (the state) and the STATE_x of each tree is looked up in the index, so the trees and log
+#do not need to be sampled at the same frequency, e.g. the trees file can be thinned without changing the log file
+#Trees without a log line are skipped and counted so they can be reported. Log lines without a tree are not used
+
+from collections import OrderedDict
+
+import tree_index
+
+#Converts a state into an integer so that states written differently, e.g. 1000 and 1.0E3, match
+def normaliseState(state):
+    try:
+        return(int(state))
+    except ValueError:
+        try:
+            return(int(float(state)))
+        except ValueError:
+            return(state)
+
+#Returns the state of a log line, the first column
+def getLogState(line):
+    return(normaliseState(line.split("\t", 1)[0]))
+
+#Indexes log lines, without the header, by their state
+#Returns a dictionary with states as keys and the position of the line in logFile as values
+def indexLog(logFile):
+    return({getLogState(line): i for i, line in enumerate(logFile)})
+
+#Counts of trees and log lines that could not be paired, and the byte offset in the trees file after the latest tree
+def createReport():
+    return({"paired": 0, "missing": 0, "missingStates": [], "offset": 0})
+
+#Yields (tree line, log line, position of the log line) for each tree in a trees file that has a log line with the same state
+#report is updated with the number of paired trees, the trees without a log line and the byte offset reached in the trees file,
+#so reading can be continued from report["offset"] with start, e.g. when resuming from a checkpoint
+def getTreeLogPairs(treesFile, logFile, report, start = 0):
+    logIndex = indexLog(logFile)
+
+    with open(treesFile, "rb") as fileobject:
+        fileobject.seek(start)
+        report["offset"] = start
+
+        for line in fileobject:
+            report["offset"] += len(line)
+
+            if line[0:4] == b"tree":
+                line = line.decode()
+                state = normaliseState(tree_index.getTreeState(line))
+                logLine = logIndex.get(state)
+
+                if logLine is None:
+                    addMissing(report, state)
+                    continue
+
+                report["paired"] += 1
+                yield((line, logFile[logLine], logLine))
+
+#Records a tree without a log line, keeping a few example states for the report
+def addMissing(report, state):
+    report["missing"] += 1
+    if len(report["missingStates"]) < 5:
+        report["missingStates"].append(state)
+
+#Pairs trees and log lines as they are read from files that are still being written
+#Log lines are kept until a tree with the same state is read. As states increase through both files, a tree whose state is lower than
+#the latest log state but is not in the log has no log line, and log lines with lower states than the latest tree are not needed
+class StateJoin:
+    def __init__(self, report):
+        self.report = report
+        #Trees waiting for their log line
+        self.trees = []
+        #Log lines that have not been paired, in the order they were read, with the position of each line in the log file
+        self.logLines = OrderedDict()
+        self.numberLogLines = 0
+        self.latestLogState = None
+
+    def addTree(self, line):
+        self.trees.append((normaliseState(tree_index.getTreeState(line)), line))
+
+    def addLog(self, line):
+        state = getLogState(line)
+        self.logLines[state] = (line, self.numberLogLines)
+        self.numberLogLines += 1
+        self.latestLogState = state
+
+    #Returns the trees that can now be paired as (tree line, log line, position of the log line)
+    #If finished is True no more log lines will be added, so trees that can not be paired are counted as missing rather than waiting
+    def getPairs(self, finished = False):
+        pairs = []
+
+        while self.trees:
+            state, line = self.trees[0]
+
+            #Remove log lines for states before this tree, these will not be paired
+            while self.logLines:
+                firstState = next(iter(self.logLines))
+                if firstState == state or not isinstance(firstState, int) or not isinstance(state, int) or firstState > state:
+                    break
+                self.logLines.popitem(last = False)
+
+            if state in self.logLines:
+                logLine, position = self.logLines.pop(state)
+                self.report["paired"] += 1
+                pairs.append((line, logLine, position))
+            elif finished or (isinstance(state, int) and isinstance(self.latestLogState, int) and self.latestLogState > state):
+                #The log has been written past this tree's state, or has ended, without including it
+                addMissing(self.report, state)
+            else:
+                #Wait for more of the log file
+                break
+
+            del(self.trees[0])
+
+        return(pairs)
+
+    #Pairs the remaining trees once the log file has ended, trees after the last log line are counted as missing as with getTreeLogPairs
+    def flush(self):
+        return(self.getPairs(finished = True))
+
+#Prints a warning if any trees did not have a log line
+def printReport(report, name = None):
+    if report["missing"]:
+        print("Warning: " + str(report["missing"]) + " trees" + (" in " + name if name else "") + " had no log line with the same " +
+              "MCMC state and were not analysed, e.g. STATE_" + ", STATE_".join([str(s) for s in report["missingStates"]]))
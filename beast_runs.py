@@ -0,0 +1,99 @@
+#Support for analysing multiple independent BEAST runs without first combining them with LogCombiner
+#Each run is a .trees and .log pair with its own burn-in. Runs are analysed in parallel, one process per run, with each process
+#writing its outputs to temporary part files that are then merged in run order into the final outputs
+#The trees in each run are expected to share the same taxa and Translate block, as is the case for independent runs of the same XML
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import run_stats
+
+#Adds the burn-in and number of threads options to an argument parser
+def addRunArguments(parser):
+    parser.add_argument("--burnin", help = "Percentage of the samples in each run to discard as burn-in. Give either a single value " +
+                        "used for every run, or one value per -t/-l pair. Default 0", nargs = "+", type = float, default = [0.0])
+    parser.add_argument("--threads", help = "Maximum number of runs analysed at the same time when multiple -t/-l pairs are given. " +
+                        "Default is one process per run", type = int, default = None)
+
+#Returns a list of runs from the -t, -l and --burnin arguments
+#Each run is a dictionary containing its number (starting at 1), trees file, log file and burn-in percentage
+def getRuns(args, parser):
+    if len(args.t) != len(args.l):
+        parser.error("the same number of trees files (-t) and log files (-l) needs to be given")
+
+    if len(args.burnin) == 1:
+        burnins = args.burnin * len(args.t)
+    elif len(args.burnin) == len(args.t):
+        burnins = args.burnin
+    else:
+        parser.error("--burnin needs to be given either once or once for each -t/-l pair")
+
+    for burnin in burnins:
+        if burnin < 0 or burnin >= 100:
+            parser.error("--burnin needs to be at least 0 and less than 100")
+
+    return([{"number": i + 1, "trees": t, "log": l, "burnin": b} for i, (t, l, b) in enumerate(zip(args.t, args.l, burnins))])
+
+#Returns the number of samples to discard from the start of a run with a given number of samples
+def getBurninSamples(numberSamples, burnin):
+    return(int(numberSamples * burnin/100.0))
+
+#Inserts the run number into a file name before its extension, e.g. summary.txt becomes summary_run1.txt
+def getRunFileName(fileName, run):
+    stem, extension = os.path.splitext(fileName)
+
+    return(stem + "_run" + str(run["number"]) + extension)
+
+#Creates a temporary directory for part files next to the given output, so parts are written to the same file system
+def createPartDirectory(outputName):
+    return(tempfile.mkdtemp(prefix = ".tree_scripts_runs_", dir = os.path.dirname(os.path.abspath(outputName))))
+
+def removePartDirectory(partDirectory):
+    shutil.rmtree(partDirectory, ignore_errors = True)
+
+#Returns the name of a part file for a given run
+def getPartName(partDirectory, run, name):
+    return(os.path.join(partDirectory, "run" + str(run["number"]) + "_" + name))
+
+#Runs the analysis of a single run in a worker process
+#Workers collect their own statistics without profiling, these are returned to be merged with the main process statistics
+def analyseRunWorker(function, run, args, outputs):
+    workerArgs = argparse.Namespace(**vars(args))
+    workerArgs.profile = None
+    stats = run_stats.RunStats(workerArgs)
+
+    result = function(run, workerArgs, outputs, stats)
+    result["stages"] = stats.stages
+    result["items"] = stats.items
+    result["peak_memory"] = run_stats.getPeakMemory()
+
+    return(result)
+
+#Analyses each run in parallel with function(run, args, outputs, stats) and returns the results in run order
+#outputs is a list containing the output file names for each run
+def analyseRuns(function, runs, args, outputs, stats):
+    threads = min(len(runs), args.threads) if args.threads else len(runs)
+
+    with multiprocessing.Pool(threads) as pool:
+        results = pool.starmap(analyseRunWorker, [(function, run, args, output) for run, output in zip(runs, outputs)])
+
+    for result in results:
+        stats.merge(result["stages"], result["items"], result["peak_memory"])
+
+    return(results)
+
+#Appends text part files to an open output file, skipping the header line of each part if skipHeader is True
+#transform, if given, is applied to each line before it is written
+def concatenateText(outFile, partNames, transform = None, skipHeader = True):
+    for partName in partNames:
+        with open(partName) as partFile:
+            if skipHeader:
+                next(partFile, None)
+            if transform is None:
+                shutil.copyfileobj(partFile, outFile)
+            else:
+                for line in partFile:
+                    outFile.write(transform(line))
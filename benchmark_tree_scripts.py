@@ -0,0 +1,313 @@
+#Benchmarks the scripts in this repository on synthetic input files of configurable size
+#Generates BEAST2 and BEAST1 style .trees/.log pairs with Bayesian skyline GroupSizes/PopSizes columns, newick trees with the trait
+#after the last _ in each tip name, trait csv files and fasta alignments
+#Each script is run as a separate process across a sweep of input sizes. The wall time, throughput and peak memory (RSS) of each
+#run are written to a json file that can be compared between commits
+#Throughput is reported as trees per second for the BEAST scripts, permutations per second for the association index scripts
+#and MB of alignment per second for extract_alignment_sites.py
+#To run: python3 benchmark_tree_scripts.py -o benchmark.json
+#To run a larger sweep: python3 benchmark_tree_scripts.py --trees 1000 10000 --tips 100 500 --permutations 1000 -o benchmark.json
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import subprocess
+import argparse
+
+#Directory containing the scripts to be benchmarked
+scriptDirectory = os.path.dirname(os.path.abspath(__file__))
+
+#Date of the latest tip in the synthetic trees
+latestDate = 2020.0
+
+#Tools that can be benchmarked
+allTools = ["calculate_bayesian_skyline", "population_change_support_BEAST", "population_increase_distribution_BEAST",
+            "association_index", "continuous_association_index", "extract_alignment_sites"]
+
+#Generates a random dated tree with a given number of tips
+#Returns the tree as a nested tuple structure of (name, height, children) and the height of each tip
+def simulateTree(numberTips, rng):
+    #Active lineages as [node, height]
+    lineages = []
+    for tip in range(numberTips):
+        height = round(rng.uniform(0.0, 10.0), 4)
+        lineages.append([("taxon" + str(tip + 1), height, []), height])
+
+    #Join 2 random lineages until a single lineage remains, the parent is always older than both children
+    while len(lineages) > 1:
+        first, second = rng.sample(range(len(lineages)), 2)
+        height = max(lineages[first][1], lineages[second][1]) + round(rng.expovariate(1.0), 4) + 0.0001
+        parent = (None, height, [lineages[first][0], lineages[second][0]])
+        for i in sorted([first, second], reverse = True):
+            del(lineages[i])
+        lineages.append([parent, height])
+
+    return(lineages[0][0])
+
+#Converts a simulated tree into a newick string
+#labels is a dictionary that converts tip names into the labels written in the newick string
+def treeToNewick(node, labels, parentHeight = None):
+    name, height, children = node
+
+    if children:
+        newick = "(" + ",".join([treeToNewick(c, labels, height) for c in children]) + ")"
+    else:
+        newick = labels[name]
+
+    if parentHeight is None:
+        return(newick + ";")
+
+    return(newick + ":" + str(round(parentHeight - height, 6)))
+
+#Extracts the tip names and heights from a simulated tree
+def getTips(node, tips = None):
+    if tips is None:
+        tips = []
+
+    if node[2]:
+        for c in node[2]:
+            getTips(c, tips)
+    else:
+        tips.append((node[0], node[1]))
+
+    return(tips)
+
+#Splits a number of internal nodes into a given number of skyline groups, each with at least 1 node
+def simulateGroupSizes(numberNodes, numberGroups, rng):
+    numberGroups = min(numberGroups, numberNodes)
+    breaks = sorted(rng.sample(range(1, numberNodes), numberGroups - 1))
+
+    return([b - a for a, b in zip([0] + breaks, breaks + [numberNodes])])
+
+#Writes a BEAST .trees and .log pair with a Bayesian skyline population model
+#bVersion is 1 or 2 and determines the format of the tree lines and log column names
+def writeBEASTFiles(prefix, numberTrees, numberTips, numberGroups, bVersion, rng):
+    treesFile = prefix + ".trees"
+    logFile = prefix + ".log"
+
+    tips = ["taxon" + str(t + 1) for t in range(numberTips)]
+    translate = {t: str(i + 1) for i, t in enumerate(tips)}
+
+    with open(treesFile, "w") as outTrees, open(logFile, "w") as outLog:
+        outTrees.write("#NEXUS\n\nBegin taxa;\n\tDimensions ntax=" + str(numberTips) + ";\n\t\tTaxlabels\n")
+        for t in tips:
+            outTrees.write("\t\t\t" + t + "\n")
+        outTrees.write("\t\t\t;\nEnd;\nBegin trees;\n\tTranslate\n")
+        outTrees.write(",\n".join(["\t\t" + translate[t] + " " + t for t in tips]) + "\n;\n")
+
+        if bVersion == "2":
+            outLog.write("#synthetic BEAST2 log\n")
+            outLog.write("Sample\tposterior\t" + "\t".join(["bPopSizes." + str(g + 1) for g in range(numberGroups)]) + "\t" +
+                         "\t".join(["bGroupSizes." + str(g + 1) for g in range(numberGroups)]) + "\n")
+        else:
+            outLog.write("# BEAST v1 synthetic log\n")
+            outLog.write("state\tposterior\t" + "\t".join(["skyline.popSize" + str(g + 1) for g in range(numberGroups)]) + "\t" +
+                         "\t".join(["skyline.groupSize" + str(g + 1) for g in range(numberGroups)]) + "\n")
+
+        for state in range(numberTrees):
+            mcmcState = state * 1000
+            tree = simulateTree(numberTips, rng)
+
+            if bVersion == "2":
+                outTrees.write("tree STATE_" + str(mcmcState) + " = " + treeToNewick(tree, translate) + "\n")
+            else:
+                outTrees.write("tree STATE_" + str(mcmcState) + " [&lnP=-1000.0] = [&R] " + treeToNewick(tree, translate) + "\n")
+
+            groupSizes = simulateGroupSizes(numberTips - 1, numberGroups, rng)
+            popSizes = [str(round(rng.lognormvariate(0.0, 1.0), 6)) for g in groupSizes]
+            outLog.write(str(mcmcState) + "\t-1000.0\t" + "\t".join(popSizes) + "\t" + "\t".join([str(g) for g in groupSizes]) + "\n")
+
+        outTrees.write("End;\n")
+
+    return(treesFile, logFile)
+
+#Writes a newick tree with a discrete trait after the last _ in each tip name and a csv file with a continuous trait for each tip
+def writeTraitFiles(prefix, numberTips, rng):
+    treeFile = prefix + ".nwk"
+    labelFile = prefix + ".csv"
+
+    tree = simulateTree(numberTips, rng)
+    labels = {t: t + "_" + rng.choice("ABCD") for t, h in getTips(tree)}
+
+    with open(treeFile, "w") as outTree:
+        outTree.write(treeToNewick(tree, labels) + "\n")
+
+    with open(labelFile, "w") as outLabels:
+        outLabels.write("Taxon,Trait\n")
+        for t in labels.values():
+            outLabels.write(t + "," + str(round(rng.gauss(0.0, 1.0), 6)) + "\n")
+
+    return(treeFile, labelFile)
+
+#Writes a fasta alignment with a given number of sequences and sites along with a file of sites to be extracted
+def writeAlignmentFiles(prefix, numberSequences, numberSites, rng):
+    alignmentFile = prefix + ".fasta"
+    sitesFile = prefix + "_sites.txt"
+
+    reference = [rng.choice("ACGT") for s in range(numberSites)]
+    with open(alignmentFile, "w") as outAlignment:
+        for eachSequence in range(numberSequences):
+            sequence = list(reference)
+            for s in rng.sample(range(numberSites), max(1, numberSites // 100)):
+                sequence[s] = rng.choice("ACGT-")
+            outAlignment.write(">sequence" + str(eachSequence + 1) + "\n" + "".join(sequence) + "\n")
+
+    with open(sitesFile, "w") as outSites:
+        for s in sorted(rng.sample(range(1, numberSites + 1), max(1, numberSites // 10))):
+            outSites.write(str(s) + "\n")
+
+    return(alignmentFile, sitesFile)
+
+#Runs a command and returns its wall time in seconds, peak RSS in KB and return code
+def runCommand(command):
+    #stderr is written to a temporary file so a failing script cannot block on a full pipe
+    with tempfile.TemporaryFile() as errorFile:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout = subprocess.DEVNULL, stderr = errorFile, cwd = scriptDirectory)
+        #wait4 returns the resource usage of this process only, rather than all children of the benchmark
+        pid, status, usage = os.wait4(process.pid, 0)
+        wallTime = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        errorFile.seek(0)
+        error = errorFile.read().decode(errors = "replace")
+
+    #ru_maxrss is in bytes on macOS and KB elsewhere
+    peakRSS = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+    return(wallTime, peakRSS, process.returncode, error)
+
+#Runs a command a given number of times and records the fastest run
+def benchmark(results, tool, parameters, command, units, unitName, repeats):
+    runs = [runCommand(command) for r in range(repeats)]
+    wallTime, peakRSS, returnCode, error = min(runs, key = lambda r: r[0])
+
+    result = {"tool": tool, "parameters": parameters, "wall_seconds": round(wallTime, 6),
+              "throughput": round(float(units)/wallTime, 6) if wallTime > 0 else None, "throughput_unit": unitName,
+              "peak_rss_kb": peakRSS, "return_code": returnCode, "repeats": repeats}
+    if returnCode != 0:
+        result["error"] = error.strip().split("\n")[-1]
+
+    results.append(result)
+    print(tool, json.dumps(parameters), str(round(wallTime, 3)) + "s", str(result["throughput"]) + " " + unitName,
+          str(peakRSS) + " KB", "" if returnCode == 0 else "FAILED")
+
+#Benchmarks the BEAST scripts across the number of trees and number of tips
+def benchmarkBEAST(args, tools, workDirectory, rng, results):
+    for bVersion in args.beast:
+        for numberTips in args.tips:
+            for numberTrees in args.trees:
+                prefix = os.path.join(workDirectory, "beast" + bVersion + "_" + str(numberTips) + "_" + str(numberTrees))
+                treesFile, logFile = writeBEASTFiles(prefix, numberTrees, numberTips, args.groups, bVersion, rng)
+                parameters = {"beast": bVersion, "trees": numberTrees, "tips": numberTips, "groups": args.groups, "windows": args.windows}
+
+                if "calculate_bayesian_skyline" in tools:
+                    command = [sys.executable, "calculate_bayesian_skyline.py", "-l", logFile, "-t", treesFile, "-s", str(latestDate),
+                               "-d1", str(latestDate - 20.0), "-d2", str(latestDate), "-a", str(args.windows), "-b", bVersion,
+                               "-n", str(numberTrees + 1), "-o", prefix + "_skyline.txt"]
+                    benchmark(results, "calculate_bayesian_skyline", parameters, command, numberTrees, "trees/s", args.repeats)
+
+                if "population_change_support_BEAST" in tools:
+                    command = [sys.executable, "population_change_support_BEAST.py", "-t", treesFile, "-l", logFile,
+                               "-d", str(latestDate), "-w", str(latestDate - 15.0), str(latestDate - 8.0), "-b", bVersion,
+                               "-n", str(numberTrees + 1), "-o", prefix + "_change"]
+                    benchmark(results, "population_change_support_BEAST", parameters, command, numberTrees, "trees/s", args.repeats)
+
+                if "population_increase_distribution_BEAST" in tools:
+                    command = [sys.executable, "population_increase_distribution_BEAST.py", "-t", treesFile, "-l", logFile,
+                               "-d", str(latestDate), "-b", bVersion, "-n", str(numberTrees + 1), "-o", prefix + "_increase.txt"]
+                    benchmark(results, "population_increase_distribution_BEAST", parameters, command, numberTrees, "trees/s", args.repeats)
+
+#Benchmarks the association index scripts across the number of tips and number of permutations
+def benchmarkAssociation(args, tools, workDirectory, rng, results):
+    for numberTips in args.tips:
+        prefix = os.path.join(workDirectory, "trait_" + str(numberTips))
+        treeFile, labelFile = writeTraitFiles(prefix, numberTips, rng)
+
+        for numberPermutations in args.permutations:
+            parameters = {"tips": numberTips, "permutations": numberPermutations}
+
+            if "association_index" in tools:
+                command = [sys.executable, "association_index.py", "-t", treeFile, "-b", str(numberPermutations)]
+                benchmark(results, "association_index", parameters, command, numberPermutations, "permutations/s", args.repeats)
+
+            if "continuous_association_index" in tools:
+                command = [sys.executable, "continuous_association_index.py", "-t", treeFile, "-l", labelFile, "-b", str(numberPermutations)]
+                benchmark(results, "continuous_association_index", parameters, command, numberPermutations, "permutations/s", args.repeats)
+
+#Benchmarks extract_alignment_sites.py across alignment sizes, in each of its extraction modes
+def benchmarkAlignment(args, tools, workDirectory, rng, results):
+    if "extract_alignment_sites" not in tools:
+        return
+
+    for numberSequences in args.sequences:
+        for numberSites in args.sites:
+            prefix = os.path.join(workDirectory, "alignment_" + str(numberSequences) + "_" + str(numberSites))
+            alignmentFile, sitesFile = writeAlignmentFiles(prefix, numberSequences, numberSites, rng)
+            alignmentSize = float(os.path.getsize(alignmentFile))/1000000.0
+
+            modes = {"region": ["-p1", "1", "-p2", str(numberSites // 2)],
+                     "sites": ["-f", sitesFile],
+                     "variable": ["--variable", "-vf", prefix + "_conversion.csv"]}
+            for mode in modes:
+                parameters = {"mode": mode, "sequences": numberSequences, "sites": numberSites, "megabytes": round(alignmentSize, 3)}
+                command = [sys.executable, "extract_alignment_sites.py", "-a", alignmentFile] + modes[mode] + ["-o", prefix + "_" + mode + ".fasta"]
+                benchmark(results, "extract_alignment_sites", parameters, command, alignmentSize, "MB/s", args.repeats)
+
+#Returns the current commit of the repository, None if this cannot be identified
+def getCommit():
+    try:
+        return(subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = scriptDirectory, stderr = subprocess.DEVNULL).decode().strip())
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tools", help = "Scripts to be benchmarked, default is all of " + ", ".join(allTools),
+                        nargs = "+", choices = allTools, default = allTools)
+    parser.add_argument("--trees", help = "Numbers of trees in the synthetic BEAST posteriors, default 100 1000",
+                        nargs = "+", type = int, default = [100, 1000])
+    parser.add_argument("--tips", help = "Numbers of tips in the synthetic trees, default 50 200",
+                        nargs = "+", type = int, default = [50, 200])
+    parser.add_argument("--groups", help = "Number of skyline groups in the synthetic log files, default 10", type = int, default = 10)
+    parser.add_argument("--windows", help = "Number of windows given to calculate_bayesian_skyline.py with -a, default 100", type = int, default = 100)
+    parser.add_argument("--beast", help = "BEAST versions of the synthetic .trees and .log files, default 2 1",
+                        nargs = "+", choices = ["1", "2"], default = ["2", "1"])
+    parser.add_argument("--permutations", help = "Numbers of permutations given to the association index scripts, default 100",
+                        nargs = "+", type = int, default = [100])
+    parser.add_argument("--sequences", help = "Numbers of sequences in the synthetic alignments, default 100",
+                        nargs = "+", type = int, default = [100])
+    parser.add_argument("--sites", help = "Numbers of sites in the synthetic alignments, default 10000 100000",
+                        nargs = "+", type = int, default = [10000, 100000])
+    parser.add_argument("--repeats", help = "Number of times each run is repeated, the fastest is reported. Default 1", type = int, default = 1)
+    parser.add_argument("--seed", help = "Random seed used to generate the synthetic files, default 1", type = int, default = 1)
+    parser.add_argument("--workdir", help = "Directory in which the synthetic files are written. These are kept if this is " +
+                        "given, otherwise a temporary directory is used and removed", default = None)
+    parser.add_argument("-o", help = "Output json file containing the benchmark results", required = True)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok = True)
+        workDirectory = os.path.abspath(args.workdir)
+    else:
+        workDirectory = tempfile.mkdtemp(prefix = "tree_scripts_benchmark_")
+
+    results = []
+    try:
+        benchmarkBEAST(args, args.tools, workDirectory, rng, results)
+        benchmarkAssociation(args, args.tools, workDirectory, rng, results)
+        benchmarkAlignment(args, args.tools, workDirectory, rng, results)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workDirectory)
+
+    with open(args.o, "w") as outFile:
+        json.dump({"commit": getCommit(), "python": platform.python_version(), "platform": platform.platform(),
+                   "seed": args.seed, "results": results}, outFile, indent = 1)
+        outFile.write("\n")
@@ -9,6 +9,13 @@ from Bio import Phylo as p
 from operator import itemgetter
 import re
 import argparse
+import run_stats
+import beast_follow
+import posterior_summary
+import column_output
+import beast_runs
+import beast_pairs
+import checkpoint
 
 #Removes the header region from a log file
 def removeHeader(logFile):
@@ -93,22 +100,72 @@ def getNodeHeights(tree, date):
 
     return(sortedNodeHeights)
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-l", help = "Log file from BEAST")
-    parser.add_argument("-t", help = "Trees file from BEAST")
-    parser.add_argument("-s", help = "Date of the latest sample")
-    parser.add_argument("-d1", help = "The earliest date to be examined")
-    parser.add_argument("-d2", help = "The latest date to be examined")
-    parser.add_argument("-b", help = "BEAST version used. Can either be 1 or 2, default is 2", default = "2")
-    parser.add_argument("-a", help = "The number of windows to be examined, default 100", default = "100")
-    parser.add_argument("-n", help = "Print update every nth tree. Default is 1000", default = "1000")
-    parser.add_argument("-o", help = "Output file")
-    args = parser.parse_args()
+#Calculates the relative genetic diversity in each window for a single tree and its log line
+def getWindowPopulationSizes(line, logTree, groupPositions, populationPositions, populationIntervals, date, stats):
+    #Read in the line as a tree
+    with stats.stage("tree parse"):
+        tree = p.read(StringIO(re.sub(".* ", "", line)), "newick")
 
+    #Extract the node heights in the tree
+    with stats.stage("node heights"):
+        nodeHeight = getNodeHeights(tree, date)
+
+    stageStart = stats.startStage()
+
+    #Extract the GroupSizes and PopSizes for the current MCMC step
+    groupSizes = [int(logTree.strip().split("\t")[i]) for i in groupPositions][::-1]
+    populationSizes = [logTree.strip().split("\t")[i] for i in populationPositions][::-1]
+
+    #The dates at which the relative genetic diversity changes, starts with the root date
+    populationChanges = [date - max(tree.depths().values())]
+
+    #Iterate through the nodes where the relative genetic diversity changes and add the dates to populationChanges
+    for node in range(len(groupSizes)):
+        populationChanges.append(nodeHeight[(sum(groupSizes[:(node+1)])-1)])
+    
+    #Extract intervals that correspond to each window of relative genetic diversity in this tree
+    populationSamples = []
+    for sampleDate in range(len(populationChanges)-1):
+        populationSamples.append([populationChanges[sampleDate], populationChanges[sampleDate+1]])
+    
+    #Extract the relative genetic diversity for each specified window in this tree
+    populationSize = [[] for i in range(len(populationIntervals))]
+    for k, sampleInterval in enumerate(populationIntervals):
+        for l,samplePopulation in enumerate(populationSamples):
+             #Check if the relative genetic diversity changes within the current interval
+            if (sampleInterval[0] >= samplePopulation[0]) and (sampleInterval[0] <= samplePopulation[1]) and (sampleInterval[1] >= samplePopulation[1]):
+                if l != (len(populationSamples)-1):
+                    #Assign to the relative genetic diversity of the later window
+                    populationSize[k] = populationSizes[l+1]
+                else:
+                    #If the interval crosses the end of the last window, use the population size value in the last window
+                    populationSize[k] = populationSizes[l]
+            #Check if the interval is within the population interval
+            elif sampleInterval[0] >= samplePopulation[0] and sampleInterval[1] <= samplePopulation[1]:
+                populationSize[k] = populationSizes[l]
+
+    #Add zeros where the date is not spanned by the tree
+    for dateInterval in range(len(populationSize)):
+        if populationSize[dateInterval] == []:
+            populationSize[dateInterval] = "0"
+
+    stats.endStage("analysis", stageStart)
+
+    return(populationSize)
+
+#Analyses a single BEAST run, writing the relative genetic diversity in each window in each tree to the files in outputs
+#run contains the trees file, log file and burn-in percentage of the run, outputs contains the -o and --npy names for this run
+#Returns the number of trees analysed and, if --summary is given, the summary of each window
+def analyseRun(run, args, outputs, stats):
     #Import the log file and remove its header
-    log = open(args.l).readlines()
-    logFile = removeHeader(log)
+    with stats.stage("log load"):
+        if args.follow:
+            #Only the column names are needed before following the log file
+            follower = beast_follow.BEASTFollower(run["trees"], run["log"])
+            logFile = [follower.readLogHeader()]
+        else:
+            log = open(run["log"]).readlines()
+            logFile = removeHeader(log)
 
     #Identify the columns in the log file that correspond to the PopSizes and GroupSizes
     groupPositions = getGroupSizes(logFile, args.b)
@@ -117,77 +174,269 @@ if __name__ == "__main__":
     #Remove the header from the log file
     del(logFile[0])
 
-    #Will be incremented with each tree
-    logLine = 0
-
-    outFile = open(args.o,"w")
+    #Number of samples at the start of the run to skip
+    burnin = beast_runs.getBurninSamples(len(logFile), run["burnin"])
 
     #Extract start and end of each interval to be examined
     populationIntervals = getStartEnd(args.d1, args.d2, args.a)
     
     j = 0
 
-    outFile.write("Sample\t" + "\t".join([str(m[0]) for m in populationIntervals]) + "\n")
+    #Progress saved by an earlier run that was stopped, None if starting from the beginning
+    resume = None
+    if args.checkpoint:
+        runCheckpoint = checkpoint.Checkpoint(args, [run["trees"], run["log"]])
+        resume = runCheckpoint.read()
+
+    if resume:
+        stats.log(1, "Resuming from " + args.checkpoint + " after " + str(resume["j"]) + " trees")
+        j = resume["j"]
+        if outputs["o"]:
+            outFile = checkpoint.reopenOutput(outputs["o"], resume["o"])
+        if outputs["npy"]:
+            outSkyline = column_output.NpyWriter(outputs["npy"] + "_skyline.npy", "d", len(populationIntervals), resume["npy"])
+            outStates = column_output.NpyWriter(outputs["npy"] + "_states.npy", "q", rows = resume["npy"])
+        summary = resume["summary"]
+    else:
+        if outputs["o"]:
+            outFile = open(outputs["o"],"w")
+            outFile.write("Sample\t" + "\t".join([str(m[0]) for m in populationIntervals]) + "\n")
+
+        if outputs["npy"]:
+            outSkyline = column_output.NpyWriter(outputs["npy"] + "_skyline.npy", "d", len(populationIntervals))
+            outStates = column_output.NpyWriter(outputs["npy"] + "_states.npy", "q")
+
+        summary = None
+        if args.summary:
+            summary = posterior_summary.WindowSummary(populationIntervals, args.summary_method, args.sketch_accuracy, args.quantiles, args.hpd)
+
+    #Flushes the output files and saves the trees analysed so far to the checkpoint
+    def saveCheckpoint():
+        runCheckpoint.write({"j": j,
+                             "report": pairReport,
+                             "o": checkpoint.getLength(outFile) if outputs["o"] else None,
+                             "npy": min(outSkyline.flush(), outStates.flush()) if outputs["npy"] else None,
+                             "summary": summary})
+
+    #Each tree is paired with the log line with the same MCMC state
+    if args.follow:
+        treeLogPairs = follower.pairs()
+        pairReport = follower.report
+        timer = beast_follow.IntervalTimer(args.follow_interval)
+    elif resume:
+        #Continue reading the trees file from the tree after the checkpoint
+        pairReport = resume["report"]
+        treeLogPairs = beast_pairs.getTreeLogPairs(run["trees"], logFile, pairReport, pairReport["offset"])
+    else:
+        pairReport = beast_pairs.createReport()
+        treeLogPairs = beast_pairs.getTreeLogPairs(run["trees"], logFile, pairReport)
 
     #Iterate through the trees, identify the corresponding log line and extract the relative genetic diversity in each window
-    with open(args.t) as fileobject:
-        for line in fileobject:
-
-            if line[0:4] == "tree":
-
-                #Print update every nth tree
-                if j %int(args.n) == 0:
-                    print("Tree", j)
-                j += 1
-
-                #Read in the line as a tree
-                tree = p.read(StringIO(re.sub(".* ", "", line)), "newick")
-                #Extract the corresponding line from the log file
-                logTree = logFile[logLine]
-
-                #Extract the node heights in the tree
-                nodeHeight = getNodeHeights(tree, float(args.s))
-
-                #Extract the GroupSizes and PopSizes for the current MCMC step
-                groupSizes = [int(logTree.strip().split("\t")[i]) for i in groupPositions][::-1]
-                populationSizes = [logTree.strip().split("\t")[i] for i in populationPositions][::-1]
-
-                #The dates at which the relative genetic diversity changes, starts with the root date
-                populationChanges = [float(args.s) - max(tree.depths().values())]
-
-                #Iterate through the nodes where the relative genetic diversity changes and add the dates to populationChanges
-                for node in range(len(groupSizes)):
-                    populationChanges.append(nodeHeight[(sum(groupSizes[:(node+1)])-1)])
-                
-                #Extract intervals that correspond to each window of relative genetic diversity in this tree
-                populationSamples = []
-                for sampleDate in range(len(populationChanges)-1):
-                    populationSamples.append([populationChanges[sampleDate], populationChanges[sampleDate+1]])
-                
-                #Extract the relative genetic diversity for each specified window in this tree
-                populationSize = [[] for i in range(int(args.a))]
-                for k, sampleInterval in enumerate(populationIntervals):
-                    for l,samplePopulation in enumerate(populationSamples):
-                         #Check if the relative genetic diversity changes within the current interval
-                        if (sampleInterval[0] >= samplePopulation[0]) and (sampleInterval[0] <= samplePopulation[1]) and (sampleInterval[1] >= samplePopulation[1]):
-                            if l != (len(populationSamples)-1):
-                                #Assign to the relative genetic diversity of the later window
-                                populationSize[k] = populationSizes[l+1]
-                            else:
-                                #If the interval crosses the end of the last window, use the population size value in the last window
-                                populationSize[k] = populationSizes[l]
-                        #Check if the interval is within the population interval
-                        elif sampleInterval[0] >= samplePopulation[0] and sampleInterval[1] <= samplePopulation[1]:
-                            populationSize[k] = populationSizes[l]
+    try:
+        for treeLog in treeLogPairs:
+            #Nothing new has been written to the files being followed
+            if treeLog is None:
+                if timer.due():
+                    if outputs["o"]:
+                        outFile.flush()
+                    beast_follow.writeAtomic(args.summary, summary.table())
+                continue
+
+            line, logTree, logPosition = treeLog
+
+            #Skip the burn-in
+            if logPosition < burnin:
+                continue
+
+            #Print update every nth tree
+            stats.progress(j, args.n, run["message"])
+            j += 1
+            stats.log(2, "MCMC " + logTree.split("\t", 1)[0])
+
+            populationSize = getWindowPopulationSizes(line, logTree, groupPositions, populationPositions, populationIntervals,
+                                                      float(args.s), stats)
             
-                #Add zeros where the date is not spanned by the tree
-                for dateInterval in range(len(populationSize)):
-                    if populationSize[dateInterval] == []:
-                        populationSize[dateInterval] = "0"
-                
-                #Write the relative genetic diversity in each window in this tree
-                outFile.write("Sample" + str(j) + "\t" + "\t".join(populationSize) + "\n")
-
-                logLine += 1
+            #Write the relative genetic diversity in each window in this tree
+            with stats.stage("output"):
+                if outputs["o"]:
+                    outFile.write("Sample" + str(j) + "\t" + "\t".join(populationSize) + "\n")
+                if summary:
+                    summary.add(populationSize)
+                if outputs["npy"]:
+                    outSkyline.write([float(v) for v in populationSize])
+                    outStates.write(column_output.getState(logTree.split("\t")[0]))
+
+            if args.checkpoint and runCheckpoint.due():
+                with stats.stage("checkpoint"):
+                    saveCheckpoint()
+
+            if args.follow and timer.due():
+                if outputs["o"]:
+                    outFile.flush()
+                beast_follow.writeAtomic(args.summary, summary.table())
+    except KeyboardInterrupt:
+        #Stop following and write the summary of the trees analysed so far
+        if not args.follow:
+            raise
     
-    outFile.close()
\ No newline at end of file
+    if outputs["o"]:
+        outFile.close()
+
+    if outputs["npy"]:
+        outSkyline.close()
+        outStates.close()
+
+    if args.follow:
+        follower.close()
+
+    if args.checkpoint:
+        runCheckpoint.remove()
+
+    beast_pairs.printReport(pairReport, run["trees"])
+
+    return({"trees": j, "summary": summary})
+
+#Merges the outputs of multiple runs written to part files into the final output files
+def mergeRuns(runs, results, args, partOutputs, populationIntervals):
+    if args.o:
+        #Renumber the samples so they are unique across runs
+        sampleNumber = 0
+        def renumber(line):
+            nonlocal sampleNumber
+            sampleNumber += 1
+            return("Sample" + str(sampleNumber) + "\t" + line.split("\t", 1)[1])
+
+        with open(args.o, "w") as outFile:
+            outFile.write("Sample\t" + "\t".join([str(m[0]) for m in populationIntervals]) + "\n")
+            beast_runs.concatenateText(outFile, [o["o"] for o in partOutputs], renumber)
+
+    if args.npy:
+        outSkyline = column_output.NpyWriter(args.npy + "_skyline.npy", "d", len(populationIntervals))
+        outStates = column_output.NpyWriter(args.npy + "_states.npy", "q")
+        outRuns = column_output.NpyWriter(args.npy + "_runs.npy", "q")
+        for run, result, o in zip(runs, results, partOutputs):
+            outSkyline.appendFile(o["npy"] + "_skyline.npy")
+            outStates.appendFile(o["npy"] + "_states.npy")
+            for tree in range(result["trees"]):
+                outRuns.write(run["number"])
+        outSkyline.close()
+        outStates.close()
+        outRuns.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", help = "Log file from BEAST. Multiple independent runs can be analysed together by giving multiple " +
+                        "log files in the same order as their trees files", nargs = "+")
+    parser.add_argument("-t", help = "Trees file from BEAST. Multiple independent runs can be analysed together by giving multiple " +
+                        "trees files", nargs = "+")
+    parser.add_argument("-s", help = "Date of the latest sample")
+    parser.add_argument("-d1", help = "The earliest date to be examined")
+    parser.add_argument("-d2", help = "The latest date to be examined")
+    parser.add_argument("-b", help = "BEAST version used. Can either be 1 or 2, default is 2", default = "2")
+    parser.add_argument("-a", help = "The number of windows to be examined, default 100", default = "100")
+    parser.add_argument("-n", help = "Print update every nth tree. Default is 1000", default = "1000")
+    parser.add_argument("-o", help = "Output file containing the relative genetic diversity in each window in each tree. Optional " +
+                        "if --summary is given", default = None)
+    parser.add_argument("--summary", help = "File to which the number of trees spanning each window and the mean, median, HPD interval " +
+                        "and quantiles of the relative genetic diversity in each window are written", default = None)
+    parser.add_argument("--summary_method", help = "Method used to calculate the summary. exact keeps every value, sketch keeps a " +
+                        "fixed maximum number of bins per window so memory does not grow with the number of trees. Default exact",
+                        choices = ["exact", "sketch"], default = "exact")
+    parser.add_argument("--sketch_accuracy", help = "Relative accuracy of the median and quantiles with --summary_method sketch. " +
+                        "HPD interval endpoints can be off by about this multiplied by the upper end of the interval, default 0.01",
+                        type = float, default = 0.01)
+    parser.add_argument("--hpd", help = "Proportion of the posterior within the HPD interval in the summary, default 0.95",
+                        type = float, default = 0.95)
+    parser.add_argument("--quantiles", help = "Quantiles included in the summary, default 0.025 0.975", nargs = "*", type = float,
+                        default = [0.025, 0.975])
+    parser.add_argument("--npy", help = "Prefix of binary output files. The relative genetic diversity in each window in each tree " +
+                        "is written to prefix_skyline.npy, the MCMC state of each tree to prefix_states.npy and the start and end of each " +
+                        "window to prefix_intervals.npy. These can be loaded with numpy.load. A description is written to " +
+                        "prefix_metadata.json", default = None)
+    parser.add_argument("--follow", help = "Follow a running BEAST analysis. New trees and log lines are analysed as they are written " +
+                        "and the --summary file is rewritten every --follow_interval seconds. Stops when the trees file is " +
+                        "complete or with Ctrl-C", action = "store_true", default = False)
+    parser.add_argument("--follow_interval", help = "Number of seconds between updates of the summary file with --follow, default 60",
+                        type = float, default = 60.0)
+    beast_runs.addRunArguments(parser)
+    checkpoint.addCheckpointArguments(parser)
+    run_stats.addStatsArguments(parser)
+    args = parser.parse_args()
+
+    if not (args.o or args.summary or args.npy):
+        parser.error("an output file needs to be given with -o, --summary and/or --npy")
+    if args.follow and not args.summary:
+        parser.error("--follow requires a summary file to be given with --summary")
+
+    runs = beast_runs.getRuns(args, parser)
+    if args.follow and (len(runs) > 1 or runs[0]["burnin"] > 0):
+        parser.error("--follow can only be used with a single run and no burn-in")
+    if args.checkpoint and (args.follow or len(runs) > 1):
+        parser.error("--checkpoint can only be used with a single run and without --follow")
+
+    stats = run_stats.RunStats(args)
+
+    #Extract start and end of each interval to be examined
+    populationIntervals = getStartEnd(args.d1, args.d2, args.a)
+
+    if args.npy:
+        outIntervals = column_output.NpyWriter(args.npy + "_intervals.npy", "d", 2)
+        for interval in populationIntervals:
+            outIntervals.write(interval)
+        outIntervals.close()
+
+    if len(runs) == 1:
+        runs[0]["message"] = "Tree"
+        results = [analyseRun(runs[0], args, {"o": args.o, "npy": args.npy}, stats)]
+    else:
+        #Analyse each run in a separate process, writing to part files that are merged once every run is complete
+        partDirectory = beast_runs.createPartDirectory(args.o or args.summary or args.npy)
+        try:
+            partOutputs = []
+            for run in runs:
+                run["message"] = "Run " + str(run["number"]) + " tree"
+                partOutputs.append({"o": beast_runs.getPartName(partDirectory, run, "skyline.txt") if args.o else None,
+                                    "npy": beast_runs.getPartName(partDirectory, run, "skyline") if args.npy else None})
+
+            results = beast_runs.analyseRuns(analyseRun, runs, args, partOutputs, stats)
+
+            with stats.stage("output"):
+                mergeRuns(runs, results, args, partOutputs, populationIntervals)
+        finally:
+            beast_runs.removePartDirectory(partDirectory)
+
+        for run, result in zip(runs, results):
+            print("Run " + str(run["number"]) + " (" + run["trees"] + "): " + str(result["trees"]) + " trees analysed after " +
+                  str(run["burnin"]) + "% burn-in")
+
+    if args.npy:
+        files = {"skyline": args.npy + "_skyline.npy",
+                 "states": args.npy + "_states.npy",
+                 "intervals": args.npy + "_intervals.npy"}
+        description = {"skyline": "Relative genetic diversity with trees as rows and windows as columns, " +
+                                  "0 where the window is not spanned by the tree",
+                       "states": "MCMC state of each tree",
+                       "intervals": "Start and end date of each window"}
+        if len(runs) > 1:
+            files["runs"] = args.npy + "_runs.npy"
+            description["runs"] = "Run number of each tree, in the order of -t/-l"
+        column_output.writeMetadata(args.npy + "_metadata.json",
+                                    {"script": "calculate_bayesian_skyline.py",
+                                     "runs": [{"trees_file": r["trees"], "log_file": r["log"], "burnin": r["burnin"]} for r in runs],
+                                     "latest_sample_date": float(args.s),
+                                     "trees": sum([r["trees"] for r in results]),
+                                     "files": files,
+                                     "description": description})
+
+    if args.summary:
+        with stats.stage("output"):
+            summary = results[0]["summary"]
+            if len(runs) > 1:
+                #Write each run's summary so the runs can be compared, then combine them
+                for run, result in zip(runs, results):
+                    beast_follow.writeAtomic(beast_runs.getRunFileName(args.summary, run), result["summary"].table())
+                for result in results[1:]:
+                    summary.merge(result["summary"])
+            beast_follow.writeAtomic(args.summary, summary.table())
+
+    stats.finish()
@@ -0,0 +1,132 @@
+#Identifies changes in relative genetic diversity from the Bayesian skyline GroupSizes and PopSizes of a batch of trees at once
+#Used by population_change_support_BEAST.py and population_increase_distribution_BEAST.py
+#The GroupSizes of each tree in a batch are converted into a matrix of cumulative node counts, giving the index of the internal node
+#at which each group ends. The dates of these nodes are gathered from a matrix of the sorted internal node dates of each tree and
+#compared to the window and the population size thresholds for every tree in the batch with array operations
+#Groups and population sizes are ordered from the root to the tips, i.e. reversed from the order of the log file columns
+
+import numpy as np
+
+#Calculates the date of each internal node in a tree, sorted from the earliest to the latest
+def getNodeDates(tree, date):
+    #The depth of each clade is calculated once for the whole tree
+    depths = tree.depths()
+
+    #Calculate the height of the root node
+    rootNodeHeight = float(max(depths.values()))
+
+    return(sorted([date - (rootNodeHeight - float(depths[clade])) for clade in tree.get_nonterminals()]))
+
+#A batch of trees to be analysed together
+#Each tree is added with its log line and its sorted internal node dates, along with any item the caller needs to write its output
+class ChangePointBatch:
+    def __init__(self, groupPositions, populationPositions):
+        self.groupPositions = groupPositions
+        self.populationPositions = populationPositions
+        self.clear()
+
+    def clear(self):
+        self.groupSizes = []
+        self.populationSizes = []
+        self.nodeDates = []
+        self.items = []
+
+    def __len__(self):
+        return(len(self.items))
+
+    def add(self, logLine, nodeDates, item = None):
+        columns = logLine.strip().split("\t")
+
+        #Each value is converted once, the GroupSizes are truncated to integers as they can be written as decimals
+        self.groupSizes.append([int(float(columns[i])) for i in self.groupPositions][::-1])
+        self.populationSizes.append([float(columns[i]) for i in self.populationPositions][::-1])
+        self.nodeDates.append(nodeDates)
+        self.items.append(item)
+
+    #Returns the matrices used to identify change points
+    #groupEnds contains the index of the node at which each group ends, the number of nodes in the group and all earlier groups
+    #groupEndDates contains the date of these nodes, NaN where the index is beyond the last node in the tree
+    #valid is False where a group ends beyond the last node in the tree
+    def getMatrices(self):
+        groupEnds = np.cumsum(np.array(self.groupSizes, dtype = np.int64), axis = 1)
+        populationSizes = np.array(self.populationSizes, dtype = float)
+
+        #Trees with different numbers of tips are padded with NaN
+        numberNodes = np.array([len(n) for n in self.nodeDates], dtype = np.int64)
+        nodeDates = np.full((len(self.nodeDates), max(numberNodes)), np.nan)
+        for i, n in enumerate(self.nodeDates):
+            nodeDates[i, :len(n)] = n
+
+        valid = groupEnds < numberNodes[:, None]
+        groupEndDates = np.take_along_axis(nodeDates, np.where(valid, groupEnds, 0), axis = 1)
+        groupEndDates[~valid] = np.nan
+
+        return(groupEnds, groupEndDates, populationSizes, valid)
+
+#Returns the index of the first True value in each row of a boolean matrix, the number of columns if there is none
+def getFirst(mask):
+    return(np.where(mask.any(axis = 1), mask.argmax(axis = 1), mask.shape[1]))
+
+#Identifies the date of the first change in relative genetic diversity within a window for each tree in a batch
+#The relative genetic diversity of the first group that ends within or after the start of the window is the baseline. A change is a
+#later group, starting no later than the end of the window, with relative genetic diversity more than percentage above the baseline
+#(or below the baseline if decrease is True)
+#Returns a list with the change date of each tree, None if there is no change or the tree does not span the window
+def getChangeDates(batch, windowStart, windowEnd, percentage, decrease):
+    if len(batch) == 0:
+        return([])
+
+    groupEnds, groupEndDates, populationSizes, valid = batch.getMatrices()
+    numberTrees, numberGroups = populationSizes.shape
+    rows = np.arange(numberTrees)
+
+    #The first group ending within or after the start of the window
+    startGroup = getFirst(valid & (groupEndDates >= windowStart))
+
+    #Groups are checked in order, so a group ending beyond the last node is reached if no earlier group ends in or after the window
+    reachesEnd = startGroup > getFirst(~valid)
+    if reachesEnd.any():
+        raise IndexError("The window start is after the most recent internal node in the tree for " + str(batch.items[reachesEnd.argmax()]))
+
+    #Trees without a baseline group, or with a baseline relative genetic diversity of 0, do not span the window
+    spans = startGroup < numberGroups
+    basePopulation = np.where(spans, populationSizes[rows, np.minimum(startGroup, numberGroups - 1)], 0.0)
+    spans &= basePopulation != 0
+
+    if decrease:
+        threshold = basePopulation - (basePopulation * (float(percentage)/float(100)))
+        changed = populationSizes[:, 1:] < threshold[:, None]
+    else:
+        threshold = basePopulation + (basePopulation * (float(percentage)/float(100)))
+        changed = populationSizes[:, 1:] > threshold[:, None]
+
+    #Group i + 1 starts at the node at which group i ends
+    later = np.arange(1, numberGroups)[None, :] > startGroup[:, None]
+    candidates = later & (groupEndDates[:, :-1] <= windowEnd) & changed & spans[:, None]
+
+    changeGroup = getFirst(candidates)
+    hasChange = changeGroup < numberGroups - 1
+    changeDates = groupEndDates[rows, np.minimum(changeGroup, max(numberGroups - 2, 0))] if numberGroups > 1 else np.zeros(numberTrees)
+
+    return([d if c else None for d, c in zip(changeDates.tolist(), hasChange.tolist())])
+
+#Identifies the date of the first increase in relative genetic diversity for each tree in a batch
+#An increase is a group with relative genetic diversity more than percentage above that of the group at the root
+#Returns a list with the increase date of each tree, None if there is no increase
+def getIncreaseDates(batch, percentage):
+    if len(batch) == 0:
+        return([])
+
+    groupEnds, groupEndDates, populationSizes, valid = batch.getMatrices()
+    numberTrees, numberGroups = populationSizes.shape
+    rows = np.arange(numberTrees)
+
+    basePopulation = populationSizes[:, 0]
+    threshold = basePopulation + (basePopulation * (float(percentage)/float(100)))
+
+    #Group i + 1 starts at the node at which group i ends
+    increaseGroup = getFirst(populationSizes[:, 1:] > threshold[:, None])
+    hasIncrease = increaseGroup < numberGroups - 1
+    increaseDates = groupEndDates[rows, np.minimum(increaseGroup, max(numberGroups - 2, 0))] if numberGroups > 1 else np.zeros(numberTrees)
+
+    return([d if c else None for d, c in zip(increaseDates.tolist(), hasIncrease.tolist())])
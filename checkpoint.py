@@ -0,0 +1,77 @@
+#Checkpoints long running scripts so they can be resumed after being stopped, e.g. by a job scheduler time limit
+#Use addCheckpointArguments to add --checkpoint and --checkpoint_interval to a script's argument parser
+#Every --checkpoint_interval seconds the script flushes its output files and saves its progress to the checkpoint file, e.g. the
+#byte offset reached in the trees file, the number of trees analysed and the length of each output file
+#No position is saved for the log file, it is read and indexed again in full on resume as trees are paired with log lines by state
+#When the script is rerun with the same options and checkpoint file, it continues from the saved progress rather than starting again.
+#Output files are truncated to their length at the checkpoint, so anything written after the checkpoint is written again
+#The checkpoint file is removed once the script is complete
+
+import os
+import pickle
+
+import beast_follow
+
+#Options that do not change the results, these can differ between the original run and the resumed run
+ignoredOptions = ["checkpoint", "checkpoint_interval", "verbosity", "stats", "stats_json", "profile", "threads", "batch_size", "n"]
+
+#Adds the checkpoint options to an argument parser
+def addCheckpointArguments(parser):
+    parser.add_argument("--checkpoint", help = "Save progress to this file so the script can be resumed if it is stopped. Rerun with " +
+                        "the same options to continue from the last checkpoint. The file is removed once the script is complete",
+                        default = None)
+    parser.add_argument("--checkpoint_interval", help = "Number of seconds between checkpoints with --checkpoint, default 300",
+                        type = float, default = 300.0)
+
+#Truncates an output file to its length at the checkpoint and opens it to continue writing
+def reopenOutput(fileName, length):
+    os.truncate(fileName, length)
+
+    return(open(fileName, "a"))
+
+#Returns the length of an open output file once everything written to it has been flushed
+def getLength(fileObject):
+    fileObject.flush()
+
+    return(fileObject.tell())
+
+#Saves and restores the progress of a script
+#inputFiles are checked on resume to make sure they have not changed since the checkpoint
+class Checkpoint:
+    def __init__(self, args, inputFiles):
+        self.fileName = args.checkpoint
+        self.timer = beast_follow.IntervalTimer(args.checkpoint_interval)
+        self.options = {name: value for name, value in vars(args).items() if name not in ignoredOptions}
+        self.inputs = {f: os.path.getsize(f) for f in inputFiles}
+
+    #Returns the progress saved in the checkpoint file, None if there is no checkpoint to resume from
+    def read(self):
+        if not os.path.exists(self.fileName):
+            return(None)
+
+        with open(self.fileName, "rb") as checkpointFile:
+            checkpoint = pickle.load(checkpointFile)
+
+        if checkpoint["options"] != self.options:
+            changed = [o for o in self.options if self.options[o] != checkpoint["options"].get(o)]
+            raise RuntimeError("The checkpoint " + self.fileName + " was saved with different options (" + ", ".join(changed) +
+                               "). Rerun with the same options or remove the checkpoint to start again")
+        if checkpoint["inputs"] != self.inputs:
+            raise RuntimeError("The input files have changed since the checkpoint " + self.fileName + " was saved. Remove the " +
+                               "checkpoint to start again")
+
+        return(checkpoint["state"])
+
+    #Returns True when the next checkpoint should be saved
+    def due(self):
+        return(self.timer.due())
+
+    #Saves progress to the checkpoint file, output files need to be flushed before this is called
+    #The file is replaced in a single step, so a script stopped while saving keeps the previous checkpoint
+    def write(self, state):
+        beast_follow.writeAtomic(self.fileName, pickle.dumps({"options": self.options, "inputs": self.inputs, "state": state}))
+
+    #Removes the checkpoint file once the script is complete
+    def remove(self):
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
@@ -0,0 +1,106 @@
+#Writes results as binary .npy column files that can be loaded or memory mapped with numpy.load without parsing text
+#Rows are appended one at a time as the trees are analysed so results do not need to be held in memory
+#The .npy header is rewritten with the final number of rows when the file is closed
+#A json metadata file alongside the .npy files describes each file and the options used to create them
+#Writing does not require numpy, numpy is only needed to read the files, e.g. numpy.load("prefix_skyline.npy", mmap_mode = "r")
+
+from array import array
+import json
+import os
+import shutil
+import sys
+
+#Size of the .npy header in bytes, this is a multiple of 64 so the data is aligned and large enough for any shape
+headerSize = 128
+
+#numpy type descriptions of the array type codes that can be written
+byteOrder = "<" if sys.byteorder == "little" else ">"
+descriptions = {"d": byteOrder + "f8", "q": byteOrder + "i8"}
+
+#Returns a .npy format header for an array with the given type code and shape
+def getHeader(typeCode, shape):
+    if len(shape) == 1:
+        shapeText = "(" + str(shape[0]) + ",)"
+    else:
+        shapeText = "(" + ", ".join([str(s) for s in shape]) + ")"
+
+    header = "{'descr': '" + descriptions[typeCode] + "', 'fortran_order': False, 'shape': " + shapeText + ", }"
+    #The magic string, version and header length take 10 bytes and the header ends with a newline
+    header = header + " " * (headerSize - 10 - len(header) - 1) + "\n"
+
+    return(b"\x93NUMPY\x01\x00" + (headerSize - 10).to_bytes(2, "little") + header.encode("latin1"))
+
+#Writes a 1 dimensional array, or a 2 dimensional array with a fixed number of columns, one row at a time
+#If rows is given, an existing file written by an NpyWriter is truncated to that number of rows and further rows are appended to it,
+#e.g. when resuming from a checkpoint
+class NpyWriter:
+    def __init__(self, fileName, typeCode = "d", numberColumns = None, rows = None):
+        self.fileName = fileName
+        self.typeCode = typeCode
+        self.numberColumns = numberColumns
+
+        if rows is not None:
+            self.rows = rows
+            os.truncate(fileName, headerSize + rows * self.getRowSize())
+            self.fileObject = open(fileName, "r+b")
+            self.fileObject.seek(0, os.SEEK_END)
+        else:
+            self.rows = 0
+            self.fileObject = open(fileName, "wb")
+            #Placeholder header, replaced with the final shape on close
+            self.fileObject.write(getHeader(typeCode, self.getShape()))
+
+    #Number of bytes in each row
+    def getRowSize(self):
+        return(array(self.typeCode).itemsize * (self.numberColumns if self.numberColumns is not None else 1))
+
+    def getShape(self):
+        if self.numberColumns is None:
+            return((self.rows,))
+
+        return((self.rows, self.numberColumns))
+
+    #Appends a single value, or a row of numberColumns values for a 2 dimensional array
+    def write(self, values):
+        if self.numberColumns is None:
+            values = [values]
+        elif len(values) != self.numberColumns:
+            raise ValueError(self.fileName + " has " + str(self.numberColumns) + " columns but a row of " + str(len(values)) +
+                             " values was written")
+
+        self.fileObject.write(array(self.typeCode, values).tobytes())
+        self.rows += 1
+
+    #Appends the rows of a .npy file written by another NpyWriter with the same type and number of columns
+    def appendFile(self, fileName):
+        rowSize = self.getRowSize()
+
+        with open(fileName, "rb") as partFile:
+            partFile.seek(headerSize)
+            shutil.copyfileobj(partFile, self.fileObject)
+
+        self.rows += (os.path.getsize(fileName) - headerSize) // rowSize
+
+    #Writes any buffered rows to the file and returns the number of rows written
+    def flush(self):
+        self.fileObject.flush()
+
+        return(self.rows)
+
+    def close(self):
+        self.fileObject.seek(0)
+        self.fileObject.write(getHeader(self.typeCode, self.getShape()))
+        self.fileObject.close()
+
+#Converts an MCMC state from a log file into an integer, BEAST can write large states in scientific notation
+def getState(MCMCState):
+    try:
+        return(int(MCMCState))
+    except ValueError:
+        return(int(float(MCMCState)))
+
+#Writes a json file describing the .npy files
+def writeMetadata(fileName, metadata):
+    with open(fileName, "w") as outMetadata:
+        json.dump(metadata, outMetadata, indent = 1)
+        outMetadata.write("\n")
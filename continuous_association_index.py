@@ -8,6 +8,7 @@ import pandas as pd
 import numpy as np
 import random
 import argparse
+import checkpoint
 
 #Extracts labels from a tree that are after the last underscore
 #Returns a dictionary with tip names as keys and traits as values
@@ -56,13 +57,24 @@ def getTraitVariance(tree, l, trait, tip_label):
     return(traitVariance)
 
 #Calculates the continuous association for a tree for a given set of traits
-def continuousAI(tree, bootstraps, labels, tip_label):
+#If runCheckpoint is given, the bootstraps completed for each trait are saved to it and resumed from it
+def continuousAI(tree, bootstraps, labels, tip_label, runCheckpoint = None):
     #If the labels are in the tree, extract them from the tree
     if tip_label:
         l = getTreeLabels(tree)
     #Import the labels csv file and extract each column
     else:
         l = getCsvLabels(labels)
+
+    #Bootstrap variances of each trait, filled from the checkpoint if the script was stopped before it was complete
+    completedBootstraps = dict()
+    if runCheckpoint:
+        resume = runCheckpoint.read()
+        if resume:
+            completedBootstraps = resume["bootstraps"]
+            #Continue the same sequence of random numbers as an uninterrupted run
+            random.setstate(resume["random_state"])
+            print("Resuming from " + runCheckpoint.fileName + " after " + str(sum([len(b) for b in completedBootstraps.values()])) + " bootstraps")
     
     #Iterate through the traits to test
     #Iterate through the tree and calculate the variance at each internal node, add to traitVariance
@@ -70,8 +82,8 @@ def continuousAI(tree, bootstraps, labels, tip_label):
         cAI = getTraitVariance(tree, l, trait, tip_label)
 
         #Calculate the bootstrap continuous association index
-        bAI = list()
-        for b in range(int(bootstraps)):
+        bAI = completedBootstraps.setdefault(trait, list())
+        for b in range(len(bAI), int(bootstraps)):
             #Assign the trait to tips randomly
             tNames = list(l[trait].keys())
             tValues = random.sample(list(l[trait].values()), len(list(l[trait].values())))
@@ -81,6 +93,10 @@ def continuousAI(tree, bootstraps, labels, tip_label):
             for i in range(len(tNames)):
                 bDict["Label"][tNames[i]] = tValues[i]
             bAI.append(getTraitVariance(tree, bDict, "Label", tip_label))
+
+            #Save the completed bootstraps and the state of the random number generator
+            if runCheckpoint and runCheckpoint.due():
+                runCheckpoint.write({"bootstraps": completedBootstraps, "random_state": random.getstate()})
         
         #Number of bootstraps with variance at least as small as real data
         nB = 0
@@ -121,10 +137,19 @@ if __name__ == "__main__":
                             "the tree. It is necessary to specify either --tip_label or provide a labels file with -l, not both",
                             action = "store_true",
                             default = False)
+    checkpoint.addCheckpointArguments(parser)
     
     args = parser.parse_args()
 
     #Import the tree
     tree = Phylo.read(args.tree, "newick")
 
-    continuousAI(tree, args.bootstraps, args.labels, args.tip_label)
\ No newline at end of file
+    if args.checkpoint:
+        runCheckpoint = checkpoint.Checkpoint(args, [args.tree] + ([args.labels] if args.labels else []))
+    else:
+        runCheckpoint = None
+
+    continuousAI(tree, args.bootstraps, args.labels, args.tip_label, runCheckpoint)
+
+    if runCheckpoint:
+        runCheckpoint.remove()
\ No newline at end of file
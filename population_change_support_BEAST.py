@@ -16,6 +16,15 @@ from Bio import Phylo as p
 from operator import itemgetter
 import re
 import argparse
+import run_stats
+import beast_follow
+import posterior_summary
+import column_output
+import tree_index
+import beast_runs
+import beast_pairs
+import change_points
+import checkpoint
 
 #Removes the header region from a log file
 def removeHeader(logFile):
@@ -86,48 +95,49 @@ def getPopulationSizes(logFile, bVersion):
     
     return(positions)
 
-#Extracts and sorts node heights in a given tree
-def getNodeHeights(tree, date):
-    #Will be filled with all of the node heights in the tree
-    nodeHeights = []
-
-    #Calculate the height of the root node
-    rootNodeHeight = float(max(tree.depths().values()))
-    
-    #Iterate through the clades, calculate their date and append to nodeHeights
-    for clade in tree.get_nonterminals():
-        nodeHeights.append(date - (rootNodeHeight - float(tree.depths()[clade])))
-    
-    #Sort the nodes heights into date order
-    sortedNodeHeights = sorted(nodeHeights)
-
-    return(sortedNodeHeights)
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-t", help = "The .trees file from BEAST containing the distribution of trees")
-    parser.add_argument("-l", help = "The .log file from BEAST")
-    parser.add_argument("-p", help = "Minimum percentage increase in relative genetic diversity above baseline " + 
-                                    "to define a population increase, default = 100", default = "100")
-    parser.add_argument("-w", help = "Time window of interest. Takes 2 decimal number: the start of the window " + 
-                                    "and the end of the window, e.g. 2010 2015 will look for a change between " +
-                                    "2010 and 2015. To look for a change at any date, set these to dates " + 
-                                    "outside the dates covered by the tree",
-                                    nargs = 2)
-    parser.add_argument("--decrease", help = "Use this option to look for a population decrease between the supplied dates. " + 
-                                    "If this option is not supplied, an increase is looked for",
-                                    action = "store_true", default = False)
-    parser.add_argument("-d", help = "Date of latest sample as decimal, e.g. 2015.54")
-    parser.add_argument("-b", help = "BEAST version used. Can either be 1 or 2, default is 2", default = "2")
-    parser.add_argument("-n", help = "Print update every nth tree. Default is 1000", default="1000")
-    parser.add_argument("-o", help = "Output file prefix. Default is to not output any files so if -o is not included, no files are saved. " + 
-                                    "If -o is included, the dates of population change, trees supporting the change and trees not supporting the " + 
-                                    "change are written", default = None)
-    args = parser.parse_args()
-
+#Parses a tree and returns the MCMC state of its log line and the sorted dates of the internal nodes in the tree
+def getTreeNodeDates(line, logTree, date, stats):
+    #Read in the line as a tree
+    with stats.stage("tree parse"):
+        tree = p.read(StringIO(re.sub(".* ", "", line)), "newick")
+    #Extract the MCMC state
+    MCMCState = logTree.strip().split("\t")[0]
+
+    #Extract the node heights in the tree
+    with stats.stage("node heights"):
+        nodeDates = change_points.getNodeDates(tree, date)
+
+    return(MCMCState, nodeDates)
+
+#Returns a summary of the support for a change as tab separated text
+#j is the number of trees analysed, k is the number of trees supporting a change and changeDates is a ValueSummary of the change dates
+def getSupportSummary(j, k, changeDates):
+    numberDates, median, lower, upper = changeDates.summary()
+
+    summary = [["Trees_analysed", j],
+               ["Trees_supporting_change", k],
+               ["Proportion_supporting_change", float(k)/float(j) if j else None],
+               ["Change_date_median", median],
+               ["Change_date_HPD95_lower", lower],
+               ["Change_date_HPD95_upper", upper]]
+
+    return("".join([s[0] + "\t" + posterior_summary.formatValue(s[1]) + "\n" for s in summary]))
+
+#Analyses a single BEAST run, identifying whether each tree supports a change in the window of interest
+#run contains the trees file, log file and burn-in percentage of the run
+#outputs contains the names of the change date distribution, supporting and not supporting trees and --npy files for this run, and
+#whether the NEXUS header and end should be written to the trees files
+#Returns the number of trees analysed, number supporting a change and the summary of the change dates
+def analyseRun(run, args, outputs, stats):
     #Import the log file and remove its header
-    log = open(args.l).readlines()
-    logFile = removeHeader(log)
+    with stats.stage("log load"):
+        if args.follow:
+            #Only the column names are needed before following the log file
+            follower = beast_follow.BEASTFollower(run["trees"], run["log"])
+            logFile = [follower.readLogHeader()]
+        else:
+            log = open(run["log"]).readlines()
+            logFile = removeHeader(log)
 
     #Identify the columns in the log file that correspond to the PopSizes and GroupSizes
     groupPositions = getGroupSizes(logFile, args.b)
@@ -136,8 +146,8 @@ if __name__ == "__main__":
     #Remove the header from the log file
     del(logFile[0])
 
-    #Will be incremented with each tree
-    logLine = 0
+    #Number of samples at the start of the run to skip
+    burnin = beast_runs.getBurninSamples(len(logFile), run["burnin"])
 
     #Extract the start and end of the window of interest
     windowStart = float(args.w[0])
@@ -148,86 +158,87 @@ if __name__ == "__main__":
     #Incremented with each tree with an increase in relative genetic diversity
     k = 0
 
+    #Dates of change used in the summary
+    changeDates = posterior_summary.ValueSummary()
+
+    #Progress saved by an earlier run that was stopped, None if starting from the beginning
+    resume = None
+    if args.checkpoint:
+        runCheckpoint = checkpoint.Checkpoint(args, [run["trees"], run["log"]])
+        resume = runCheckpoint.read()
+
+    if args.o and args.index:
+        #Write lists of the states and byte offsets of trees rather than the trees themselves
+        with stats.stage("tree index"):
+            stateOffsets = tree_index.getStateOffsets(tree_index.getIndex(run["trees"]))
+
+    if resume:
+        stats.log(1, "Resuming from " + args.checkpoint + " after " + str(resume["j"]) + " trees")
+        j = resume["j"]
+        k = resume["k"]
+        changeDates = resume["changeDates"]
+        if args.o:
+            out_distribution = checkpoint.reopenOutput(outputs["distribution"], resume["distribution"])
+            out_trees_s = checkpoint.reopenOutput(outputs["trees_s"], resume["trees_s"])
+            out_trees_n = checkpoint.reopenOutput(outputs["trees_n"], resume["trees_n"])
     #Open output files
-    if args.o:
-        out_distribution = open(args.o + "_population_change_distribution.csv", "w")
+    elif args.o:
+        out_distribution = open(outputs["distribution"], "w")
         out_distribution.write("MCMC_step,Date_of_change\n")
-        out_trees_s = open(args.o + "_trees_supporting.nex", "w")
-        out_trees_n = open(args.o + "_trees_not_supporting.nex", "w")
-    
-        #Extract the header from the trees file and write to the trees output files
-        treesHeader = getTreesHeader(args.t)
-        out_trees_s.write("".join(treesHeader))
-        out_trees_n.write("".join(treesHeader))
-
-    #Iterate through the trees, identify the corresponding log line and determine if and when the relative genetic diversity increased
-    with open(args.t) as fileobject:
-        for line in fileobject:
-
-            if line[0:4] == "tree":
-
-                #Print update every nth tree
-                if j % int(args.n) == 0:
-                    print("Analysing tree", j)
-                j += 1
-
-                #Read in the line as a tree
-                tree = p.read(StringIO(re.sub(".* ", "", line)), "newick")
-                #Extract the corresponding line from the log file
-                logTree = logFile[logLine]
-                #Extract the MCMC state
-                MCMCState = logTree.strip().split("\t")[0]
-
-                #Extract the node heights in the tree
-                nodeHeight = getNodeHeights(tree, float(args.d))
-
-                #Extract the GroupSizes and PopSizes for the current MCMC step
-                groupSizes = [logTree.strip().split("\t")[i] for i in groupPositions][::-1]
-                populationSizes = [logTree.strip().split("\t")[i] for i in populationPositions][::-1]
-
-                #Will change away from None if there is an increase within the window in the current MCMC step
-                changeDate = None
-                basePopulation = None
-
-                #Calculate the relative genetic diversity at the start of the window of interest
-                for i, groupSize in enumerate(groupSizes):
-                    #Check if the end of the current group of nodes is in the window, the first group that is will be the base population
-                    if float(nodeHeight[sum(int(float(a)) for a in groupSizes[:(i + 1)])]) >= windowStart:
-                        startGroup = i
-                        basePopulation = float(populationSizes[i])
-                        basePopulationIncrease = basePopulation + (basePopulation * (float(args.p)/float(100)))
-                        basePopulationDecrease = basePopulation - (basePopulation * (float(args.p)/float(100)))
-                        break
-                
-                print("MCMC " + MCMCState)
-                
-                #Check if the tree spans the window
-                if basePopulation:
-                    #The population changes within the window of interest if its first node is within the window
-                    #Iterate through the remaining groups, check if they start in the window, if they do check if they change by the required amount
-                    for i, eachGroup in enumerate(groupSizes[(startGroup + 1):]):
-                        #The first node in the current window is the sum of the nodes in the previous windows
-                        #Check if the switch is within the window of interest
-                        if float(nodeHeight[sum(int(float(a)) for a in groupSizes[:(startGroup + i + 1)])]) <= windowEnd:
-                            #Check if the group has the required population change
-                            if args.decrease:
-                                if float(populationSizes[startGroup + i + 1]) < basePopulationDecrease:
-                                    if args.o:
-                                        if not changeDate:
-                                            out_distribution.write(str(MCMCState) + "," + str(nodeHeight[sum(int(float(a)) for a in groupSizes[:(startGroup + i + 1)])]) + "\n")
-                                    changeDate = "Yes"
-                            else:
-                                if float(populationSizes[startGroup + i + 1]) > basePopulationIncrease:
-                                    if args.o:
-                                        if not changeDate:
-                                            out_distribution.write(str(MCMCState) + "," + str(nodeHeight[sum(int(float(a)) for a in groupSizes[:(startGroup + i + 1)])]) + "\n")
-                                    changeDate = "Yes"
-                
-                #Check if there was an increase/decrease in the window of interest within this MCMC step
-                if changeDate == "Yes":
+        out_trees_s = open(outputs["trees_s"], "w")
+        out_trees_n = open(outputs["trees_n"], "w")
+        if args.index:
+            out_trees_s.write("State\tOffset\tLength\n")
+            out_trees_n.write("State\tOffset\tLength\n")
+        elif outputs["nexus_header"]:
+            #Extract the header from the trees file and write to the trees output files
+            if args.follow:
+                treesHeader = follower.readTreesHeader()
+            else:
+                treesHeader = getTreesHeader(run["trees"])
+            out_trees_s.write("".join(treesHeader))
+            out_trees_n.write("".join(treesHeader))
+
+    if outputs["npy"]:
+        outStates = column_output.NpyWriter(outputs["npy"] + "_states.npy", "q", rows = resume["npy"] if resume else None)
+        outDates = column_output.NpyWriter(outputs["npy"] + "_change_dates.npy", "d", rows = resume["npy"] if resume else None)
+
+    #Each tree is paired with the log line with the same MCMC state
+    if args.follow:
+        treeLogPairs = follower.pairs()
+        pairReport = follower.report
+        timer = beast_follow.IntervalTimer(args.follow_interval)
+    elif resume:
+        #Continue reading the trees file from the tree after the checkpoint
+        pairReport = resume["report"]
+        treeLogPairs = beast_pairs.getTreeLogPairs(run["trees"], logFile, pairReport, pairReport["offset"])
+    else:
+        pairReport = beast_pairs.createReport()
+        treeLogPairs = beast_pairs.getTreeLogPairs(run["trees"], logFile, pairReport)
+
+    #Trees are analysed in batches of --batch_size trees
+    batch = change_points.ChangePointBatch(groupPositions, populationPositions)
+
+    #Identifies the trees in the batch with an increase/decrease in the window of interest and writes them to the output files
+    def analyseBatch():
+        nonlocal k
+
+        with stats.stage("analysis"):
+            batchChangeDates = change_points.getChangeDates(batch, windowStart, windowEnd, args.p, args.decrease)
+
+        with stats.stage("output"):
+            for (MCMCState, line), changeDate in zip(batch.items, batchChangeDates):
+                if args.o and args.index:
+                    treeState = tree_index.getTreeState(line)
+                    offset, length = stateOffsets[treeState]
+                    line = treeState + "\t" + str(offset) + "\t" + str(length) + "\n"
+
+                if changeDate is not None:
                     k += 1
+                    changeDates.add(changeDate)
 
                     if args.o:
+                        out_distribution.write(str(MCMCState) + "," + str(changeDate) + "\n")
                         #Write the tree to the supporting file
                         out_trees_s.write(line)
                 else:
@@ -235,13 +246,259 @@ if __name__ == "__main__":
                         #Write the tree to the non-supporting file
                         out_trees_n.write(line)
 
-                logLine += 1
-    
-    print("The proportion of trees with a population change in the required window is " + str(float(k)/float(j)))
+                if outputs["npy"]:
+                    outStates.write(column_output.getState(MCMCState))
+                    outDates.write(float("nan") if changeDate is None else changeDate)
+
+        batch.clear()
+
+    #Analyses the trees read so far, flushes the output files and saves progress to the checkpoint
+    def saveCheckpoint():
+        analyseBatch()
+        runCheckpoint.write({"j": j,
+                             "k": k,
+                             "report": pairReport,
+                             "distribution": checkpoint.getLength(out_distribution) if args.o else None,
+                             "trees_s": checkpoint.getLength(out_trees_s) if args.o else None,
+                             "trees_n": checkpoint.getLength(out_trees_n) if args.o else None,
+                             "npy": min(outStates.flush(), outDates.flush()) if outputs["npy"] else None,
+                             "changeDates": changeDates})
+
+    #Iterate through the trees, identify the corresponding log line and determine if and when the relative genetic diversity increased
+    try:
+        for treeLog in treeLogPairs:
+            #Nothing new has been written to the files being followed, analyse the trees read so far
+            if treeLog is None:
+                analyseBatch()
+                if timer.due():
+                    beast_follow.writeAtomic(args.summary, getSupportSummary(j, k, changeDates))
+                continue
+
+            line, logTree, logPosition = treeLog
+
+            #Skip the burn-in
+            if logPosition < burnin:
+                continue
+
+            #Print update every nth tree
+            stats.progress(j, args.n, run["message"])
+            j += 1
+
+            MCMCState, nodeDates = getTreeNodeDates(line, logTree, float(args.d), stats)
+            stats.log(2, "MCMC " + MCMCState)
+
+            batch.add(logTree, nodeDates, (MCMCState, line))
+            if len(batch) >= args.batch_size:
+                analyseBatch()
+
+            if args.checkpoint and runCheckpoint.due():
+                with stats.stage("checkpoint"):
+                    saveCheckpoint()
+
+            if args.follow and timer.due():
+                analyseBatch()
+                beast_follow.writeAtomic(args.summary, getSupportSummary(j, k, changeDates))
+    except KeyboardInterrupt:
+        #Stop following and report the trees analysed so far
+        if not args.follow:
+            raise
+
+    #Analyse the remaining trees
+    analyseBatch()
+
+    if outputs["npy"]:
+        outStates.close()
+        outDates.close()
 
     if args.o:
-        out_trees_s.write("End;")
-        out_trees_n.write("End;")
+        if outputs["nexus_header"] and not args.index:
+            out_trees_s.write("End;")
+            out_trees_n.write("End;")
         out_distribution.close()
         out_trees_s.close()
-        out_trees_n.close()
\ No newline at end of file
+        out_trees_n.close()
+
+    if args.follow:
+        follower.close()
+
+    if args.checkpoint:
+        runCheckpoint.remove()
+
+    beast_pairs.printReport(pairReport, run["trees"])
+
+    return({"trees": j, "supporting": k, "changeDates": changeDates})
+
+#Returns the names of the output files for a run
+#With multiple runs, the outputs are written to part files that are merged once every run is complete, other than the --index lists
+#which are written for each run as the offsets refer to that run's trees file
+def getRunOutputs(args, run, partDirectory = None):
+    treesExtension = ".tsv" if args.index else ".nex"
+
+    if partDirectory is None:
+        outputs = {"npy": args.npy, "nexus_header": True}
+        if args.o:
+            outputs["distribution"] = args.o + "_population_change_distribution.csv"
+            outputs["trees_s"] = args.o + "_trees_supporting" + treesExtension
+            outputs["trees_n"] = args.o + "_trees_not_supporting" + treesExtension
+    else:
+        outputs = {"npy": beast_runs.getPartName(partDirectory, run, "change") if args.npy else None, "nexus_header": False}
+        if args.o:
+            outputs["distribution"] = beast_runs.getPartName(partDirectory, run, "distribution.csv")
+            if args.index:
+                outputs["trees_s"] = args.o + "_run" + str(run["number"]) + "_trees_supporting.tsv"
+                outputs["trees_n"] = args.o + "_run" + str(run["number"]) + "_trees_not_supporting.tsv"
+            else:
+                outputs["trees_s"] = beast_runs.getPartName(partDirectory, run, "trees_supporting.nex")
+                outputs["trees_n"] = beast_runs.getPartName(partDirectory, run, "trees_not_supporting.nex")
+
+    return(outputs)
+
+#Merges the outputs of multiple runs written to part files into the final output files
+def mergeRuns(runs, results, args, partOutputs):
+    if args.o:
+        with open(args.o + "_population_change_distribution.csv", "w") as out_distribution:
+            out_distribution.write("MCMC_step,Date_of_change,Run\n")
+            for run, o in zip(runs, partOutputs):
+                beast_runs.concatenateText(out_distribution, [o["distribution"]], lambda line: line.strip() + "," + str(run["number"]) + "\n")
+
+        if not args.index:
+            #The header of the first run's trees file is used for the combined trees
+            treesHeader = "".join(getTreesHeader(runs[0]["trees"]))
+            for name, key in [("_trees_supporting.nex", "trees_s"), ("_trees_not_supporting.nex", "trees_n")]:
+                with open(args.o + name, "w") as out_trees:
+                    out_trees.write(treesHeader)
+                    beast_runs.concatenateText(out_trees, [o[key] for o in partOutputs], skipHeader = False)
+                    out_trees.write("End;")
+
+    if args.npy:
+        outStates = column_output.NpyWriter(args.npy + "_states.npy", "q")
+        outDates = column_output.NpyWriter(args.npy + "_change_dates.npy", "d")
+        outRuns = column_output.NpyWriter(args.npy + "_runs.npy", "q")
+        for run, result, o in zip(runs, results, partOutputs):
+            outStates.appendFile(o["npy"] + "_states.npy")
+            outDates.appendFile(o["npy"] + "_change_dates.npy")
+            for tree in range(result["trees"]):
+                outRuns.write(run["number"])
+        outStates.close()
+        outDates.close()
+        outRuns.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", help = "The .trees file from BEAST containing the distribution of trees. Multiple independent runs can be " +
+                                    "analysed together by giving multiple trees files", nargs = "+")
+    parser.add_argument("-l", help = "The .log file from BEAST. With multiple runs, give the log files in the same order as their trees files",
+                                    nargs = "+")
+    parser.add_argument("-p", help = "Minimum percentage increase in relative genetic diversity above baseline " + 
+                                    "to define a population increase, default = 100", default = "100")
+    parser.add_argument("-w", help = "Time window of interest. Takes 2 decimal number: the start of the window " + 
+                                    "and the end of the window, e.g. 2010 2015 will look for a change between " +
+                                    "2010 and 2015. To look for a change at any date, set these to dates " + 
+                                    "outside the dates covered by the tree",
+                                    nargs = 2)
+    parser.add_argument("--decrease", help = "Use this option to look for a population decrease between the supplied dates. " + 
+                                    "If this option is not supplied, an increase is looked for",
+                                    action = "store_true", default = False)
+    parser.add_argument("-d", help = "Date of latest sample as decimal, e.g. 2015.54")
+    parser.add_argument("-b", help = "BEAST version used. Can either be 1 or 2, default is 2", default = "2")
+    parser.add_argument("-n", help = "Print update every nth tree. Default is 1000", default="1000")
+    parser.add_argument("--batch_size", help = "Number of trees analysed together, larger values are faster but use more memory. " +
+                        "Default 1000", type = int, default = 1000)
+    parser.add_argument("-o", help = "Output file prefix. Default is to not output any files so if -o is not included, no files are saved. " + 
+                                    "If -o is included, the dates of population change, trees supporting the change and trees not supporting the " + 
+                                    "change are written", default = None)
+    parser.add_argument("--index", help = "With -o, write the MCMC state, byte offset and length of the trees supporting and not supporting " +
+                                    "the change to _trees_supporting.tsv and _trees_not_supporting.tsv rather than copying the trees to " +
+                                    "NEXUS files. The offsets are saved in an index of the trees file, BEAST.trees.idx, which is built " +
+                                    "if needed. NEXUS files can be written from the lists with tree_index.py extract",
+                                    action = "store_true", default = False)
+    parser.add_argument("--summary", help = "File to which the number and proportion of trees supporting a change, and the median " +
+                                    "and 95%% HPD interval of the change dates, are written", default = None)
+    parser.add_argument("--npy", help = "Prefix of binary output files. The MCMC state of each tree is written to prefix_states.npy " +
+                                    "and the date of the first change within the window in each tree, or NaN if there is none, to " +
+                                    "prefix_change_dates.npy. These can be loaded with numpy.load. A description is written to prefix_metadata.json", default = None)
+    parser.add_argument("--follow", help = "Follow a running BEAST analysis. New trees and log lines are analysed as they are written " +
+                                    "and the --summary file is rewritten every --follow_interval seconds. Stops when the trees file is " +
+                                    "complete or with Ctrl-C", action = "store_true", default = False)
+    parser.add_argument("--follow_interval", help = "Number of seconds between updates of the summary file with --follow, default 60",
+                                    type = float, default = 60.0)
+    beast_runs.addRunArguments(parser)
+    checkpoint.addCheckpointArguments(parser)
+    run_stats.addStatsArguments(parser)
+    args = parser.parse_args()
+
+    if args.follow and not args.summary:
+        parser.error("--follow requires a summary file to be given with --summary")
+    if args.follow and args.index:
+        parser.error("--index cannot be used with --follow as the trees file is still being written")
+
+    runs = beast_runs.getRuns(args, parser)
+    if args.follow and (len(runs) > 1 or runs[0]["burnin"] > 0):
+        parser.error("--follow can only be used with a single run and no burn-in")
+    if args.checkpoint and (args.follow or len(runs) > 1):
+        parser.error("--checkpoint can only be used with a single run and without --follow")
+
+    stats = run_stats.RunStats(args)
+
+    if len(runs) == 1:
+        runs[0]["message"] = "Analysing tree"
+        results = [analyseRun(runs[0], args, getRunOutputs(args, runs[0]), stats)]
+    else:
+        #Analyse each run in a separate process, writing to part files that are merged once every run is complete
+        partDirectory = beast_runs.createPartDirectory(args.o or args.summary or args.npy or ".")
+        try:
+            for run in runs:
+                run["message"] = "Run " + str(run["number"]) + " analysing tree"
+            partOutputs = [getRunOutputs(args, run, partDirectory) for run in runs]
+
+            results = beast_runs.analyseRuns(analyseRun, runs, args, partOutputs, stats)
+
+            with stats.stage("output"):
+                mergeRuns(runs, results, args, partOutputs)
+        finally:
+            beast_runs.removePartDirectory(partDirectory)
+
+        #Report each run separately so the runs can be compared
+        for run, result in zip(runs, results):
+            print("Run " + str(run["number"]) + " (" + run["trees"] + "): " + str(result["trees"]) + " trees analysed after " +
+                  str(run["burnin"]) + "% burn-in, proportion with a population change in the required window is " +
+                  str(float(result["supporting"])/float(result["trees"])))
+
+    #Combine the runs
+    j = sum([r["trees"] for r in results])
+    k = sum([r["supporting"] for r in results])
+    changeDates = posterior_summary.ValueSummary()
+    for result in results:
+        changeDates.merge(result["changeDates"])
+    
+    print("The proportion of trees with a population change in the required window is " + str(float(k)/float(j)))
+
+    if args.summary:
+        with stats.stage("output"):
+            if len(runs) > 1:
+                for run, result in zip(runs, results):
+                    beast_follow.writeAtomic(beast_runs.getRunFileName(args.summary, run),
+                                             getSupportSummary(result["trees"], result["supporting"], result["changeDates"]))
+            beast_follow.writeAtomic(args.summary, getSupportSummary(j, k, changeDates))
+
+    if args.npy:
+        files = {"states": args.npy + "_states.npy",
+                 "change_dates": args.npy + "_change_dates.npy"}
+        description = {"states": "MCMC state of each tree",
+                       "change_dates": "Date of the first change in relative genetic diversity within the window in each tree, " +
+                                       "NaN if there is none"}
+        if len(runs) > 1:
+            files["runs"] = args.npy + "_runs.npy"
+            description["runs"] = "Run number of each tree, in the order of -t/-l"
+        column_output.writeMetadata(args.npy + "_metadata.json",
+                                    {"script": "population_change_support_BEAST.py",
+                                     "runs": [{"trees_file": r["trees"], "log_file": r["log"], "burnin": r["burnin"]} for r in runs],
+                                     "latest_sample_date": float(args.d),
+                                     "percentage": float(args.p),
+                                     "window": [float(args.w[0]), float(args.w[1])],
+                                     "decrease": args.decrease,
+                                     "trees": j,
+                                     "files": files,
+                                     "description": description})
+
+    stats.finish()
@@ -11,6 +11,12 @@ from Bio import Phylo as p
 from operator import itemgetter
 import re
 import argparse
+import run_stats
+import column_output
+import beast_runs
+import beast_pairs
+import change_points
+import checkpoint
 
 #Removes the header region from a log file
 def removeHeader(logFile):
@@ -68,41 +74,28 @@ def getPopulationSizes(logFile, bVersion):
     
     return(positions)
 
-#Extracts and sorts node heights in a given tree
-def getNodeHeights(tree, date):
-    #Will be filled with all of the node heights in the tree
-    nodeHeights = []
+#Parses a tree and returns the MCMC state of its log line and the sorted dates of the internal nodes in the tree
+def getTreeNodeDates(line, logTree, date, stats):
+    #Read in the line as a tree
+    with stats.stage("tree parse"):
+        tree = p.read(StringIO(re.sub(".* ", "", line)), "newick")
+    #Extract the MCMC state
+    MCMCState = logTree.strip().split("\t")[0]
 
-    #Calculate the height of the root node
-    rootNodeHeight = float(max(tree.depths().values()))
-    
-    #Iterate through the clades, calculate their date and append to nodeHeights
-    for clade in tree.get_nonterminals():
-        nodeHeights.append(date - (rootNodeHeight - float(tree.depths()[clade])))
-    
-    #Sort the nodes heights into date order
-    sortedNodeHeights = sorted(nodeHeights)
+    #Extract the node heights in the tree
+    with stats.stage("node heights"):
+        nodeDates = change_points.getNodeDates(tree, date)
 
-    return(sortedNodeHeights)
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-t", help = "The .trees file from BEAST containing the distribution of trees")
-    parser.add_argument("-l", help = "The .log file from BEAST")
-    parser.add_argument("-p", help = "Minimum percentage increase in relative genetic diversity above baseline " + 
-                                    "to define a population increase, default = 100", default = "100")
-    parser.add_argument("-d", help = "Date of latest sample as decimal, e.g. 2015.54")
-    parser.add_argument("-b", help = "BEAST version used. Can either be 1 or 2, default is 2", default = "2")
-    parser.add_argument("-n", help = "Print update every nth tree. Default is 1000", default="1000")
-    parser.add_argument("-o", help = "Output file name")
-    args = parser.parse_args()
+    return(MCMCState, nodeDates)
 
+#Analyses a single BEAST run, identifying the date of the first increase in each tree
+#run contains the trees file, log file and burn-in percentage of the run, outputs contains the -o and --npy names for this run
+#Returns the number of trees analysed and the number with an increase
+def analyseRun(run, args, outputs, stats):
     #Import the log file and remove its header
-    log = open(args.l).readlines()
-    logFile = removeHeader(log)
-
-    outFile = open(args.o, "w")
-    outFile.write("MCMC_state\tIncrease_date\n")
+    with stats.stage("log load"):
+        log = open(run["log"]).readlines()
+        logFile = removeHeader(log)
 
     #Identify the columns in the log file that correspond to the PopSizes and GroupSizes
     groupPositions = getGroupSizes(logFile, args.b)
@@ -111,65 +104,206 @@ if __name__ == "__main__":
     #Remove the header from the log file
     del(logFile[0])
 
-    #Will be incremented with each tree
-    logLine = 0
+    #Number of samples at the start of the run to skip
+    burnin = beast_runs.getBurninSamples(len(logFile), run["burnin"])
 
     #Incremented with each tree
     j = 0
     #Incremented with each tree with an increase in relative genetic diversity
     k = 0
 
-    #Iterate through the trees, identify the corresponding log line and determine if and when the relative genetic diversity increased
-    with open(args.t) as fileobject:
-        for line in fileobject:
-
-            if line[0:4] == "tree":
-
-                #Print update every nth tree
-                if j % int(args.n) == 0:
-                    print("Analysing tree", j)
-                j += 1
-
-                #Read in the line as a tree
-                tree = p.read(StringIO(re.sub(".* ", "", line)), "newick")
-                #Extract the corresponding line from the log file
-                logTree = logFile[logLine]
-                #Extract the MCMC state
-                MCMCState = logTree.strip().split("\t")[0]
-
-                #Extract the node heights in the tree
-                nodeHeight = getNodeHeights(tree, float(args.d))
-
-                #Extract the GroupSizes and PopSizes for the current MCMC step
-                groupSizes = [logTree.strip().split("\t")[i] for i in groupPositions][::-1]
-                populationSizes = [logTree.strip().split("\t")[i] for i in populationPositions][::-1]
-                #The size of the population above which will be considered an increase
-                basePopulation = float(populationSizes[0])
-                basePopulationIncrease = basePopulation + (basePopulation * (float(args.p)/float(100)))
-
-                #Will change away from None if there is an increase within the current MCMC step
-                increaseDate = None
-
-                #Iterate through the adjacent population size pairs, check if the population has increased >= args.p above baseline
-                #and identify the number of nodes at the switch point if so
-                for populationSize in range(1, len(populationSizes)):
-                    if float(populationSizes[populationSize]) > basePopulationIncrease:
-                        #Check if the increase occurred in the first group, if it does use the number of nodes in the first group to identify the increase date
-                        if populationSize == 1:
-                            nodeNumber = int(float(groupSizes[0]))
-                        #Sum the nodes up to the increase to identify the increase date
-                        else:
-                            nodeNumber = sum([int(float(k)) for k in groupSizes[:populationSize]])
-                        increaseDate = nodeHeight[int(nodeNumber)]
-                        break
-                
+    #Progress saved by an earlier run that was stopped, None if starting from the beginning
+    resume = None
+    if args.checkpoint:
+        runCheckpoint = checkpoint.Checkpoint(args, [run["trees"], run["log"]])
+        resume = runCheckpoint.read()
+
+    if resume:
+        stats.log(1, "Resuming from " + args.checkpoint + " after " + str(resume["j"]) + " trees")
+        j = resume["j"]
+        k = resume["k"]
+        outFile = checkpoint.reopenOutput(outputs["o"], resume["o"])
+        if outputs["npy"]:
+            outStates = column_output.NpyWriter(outputs["npy"] + "_states.npy", "q", rows = resume["npy"])
+            outDates = column_output.NpyWriter(outputs["npy"] + "_increase_dates.npy", "d", rows = resume["npy"])
+    else:
+        outFile = open(outputs["o"], "w")
+        outFile.write("MCMC_state\tIncrease_date\n")
+
+        if outputs["npy"]:
+            outStates = column_output.NpyWriter(outputs["npy"] + "_states.npy", "q")
+            outDates = column_output.NpyWriter(outputs["npy"] + "_increase_dates.npy", "d")
+
+    #Trees are analysed in batches of --batch_size trees
+    batch = change_points.ChangePointBatch(groupPositions, populationPositions)
+
+    #Identifies the date of the first increase in each tree in the batch and writes them to the output files
+    def analyseBatch():
+        nonlocal k
+
+        with stats.stage("analysis"):
+            increaseDates = change_points.getIncreaseDates(batch, args.p)
+
+        with stats.stage("output"):
+            for MCMCState, increaseDate in zip(batch.items, increaseDates):
                 if increaseDate:
                     outFile.write(MCMCState + "\t" + str(increaseDate) + "\n")
                     k += 1
 
-                logLine += 1
+                if outputs["npy"]:
+                    outStates.write(column_output.getState(MCMCState))
+                    outDates.write(increaseDate if increaseDate else float("nan"))
+
+        batch.clear()
+
+    #Analyses the trees read so far, flushes the output files and saves progress to the checkpoint
+    def saveCheckpoint():
+        analyseBatch()
+        runCheckpoint.write({"j": j,
+                             "k": k,
+                             "report": pairReport,
+                             "o": checkpoint.getLength(outFile),
+                             "npy": min(outStates.flush(), outDates.flush()) if outputs["npy"] else None})
+
+    #Each tree is paired with the log line with the same MCMC state, continuing from the tree after the checkpoint if resuming
+    if resume:
+        pairReport = resume["report"]
+    else:
+        pairReport = beast_pairs.createReport()
+
+    #Iterate through the trees, identify the corresponding log line and determine if and when the relative genetic diversity increased
+    for line, logTree, logPosition in beast_pairs.getTreeLogPairs(run["trees"], logFile, pairReport, pairReport["offset"]):
+        #Skip the burn-in
+        if logPosition < burnin:
+            continue
+
+        #Print update every nth tree
+        stats.progress(j, args.n, run["message"])
+        j += 1
+
+        MCMCState, nodeDates = getTreeNodeDates(line, logTree, float(args.d), stats)
+        stats.log(2, "MCMC " + MCMCState)
+
+        batch.add(logTree, nodeDates, MCMCState)
+        if len(batch) >= args.batch_size:
+            analyseBatch()
+
+        if args.checkpoint and runCheckpoint.due():
+            with stats.stage("checkpoint"):
+                saveCheckpoint()
+
+    #Analyse the remaining trees
+    analyseBatch()
+    
+    outFile.close()
+
+    if outputs["npy"]:
+        outStates.close()
+        outDates.close()
+
+    if args.checkpoint:
+        runCheckpoint.remove()
+
+    beast_pairs.printReport(pairReport, run["trees"])
+
+    return({"trees": j, "increases": k})
+
+#Merges the outputs of multiple runs written to part files into the final output files
+def mergeRuns(runs, results, args, partOutputs):
+    with open(args.o, "w") as outFile:
+        outFile.write("MCMC_state\tIncrease_date\tRun\n")
+        for run, o in zip(runs, partOutputs):
+            beast_runs.concatenateText(outFile, [o["o"]], lambda line: line.strip() + "\t" + str(run["number"]) + "\n")
+
+    if args.npy:
+        outStates = column_output.NpyWriter(args.npy + "_states.npy", "q")
+        outDates = column_output.NpyWriter(args.npy + "_increase_dates.npy", "d")
+        outRuns = column_output.NpyWriter(args.npy + "_runs.npy", "q")
+        for run, result, o in zip(runs, results, partOutputs):
+            outStates.appendFile(o["npy"] + "_states.npy")
+            outDates.appendFile(o["npy"] + "_increase_dates.npy")
+            for tree in range(result["trees"]):
+                outRuns.write(run["number"])
+        outStates.close()
+        outDates.close()
+        outRuns.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", help = "The .trees file from BEAST containing the distribution of trees. Multiple independent runs can be " +
+                                    "analysed together by giving multiple trees files", nargs = "+")
+    parser.add_argument("-l", help = "The .log file from BEAST. With multiple runs, give the log files in the same order as their trees files",
+                                    nargs = "+")
+    parser.add_argument("-p", help = "Minimum percentage increase in relative genetic diversity above baseline " + 
+                                    "to define a population increase, default = 100", default = "100")
+    parser.add_argument("-d", help = "Date of latest sample as decimal, e.g. 2015.54")
+    parser.add_argument("-b", help = "BEAST version used. Can either be 1 or 2, default is 2", default = "2")
+    parser.add_argument("-n", help = "Print update every nth tree. Default is 1000", default="1000")
+    parser.add_argument("--batch_size", help = "Number of trees analysed together, larger values are faster but use more memory. " +
+                        "Default 1000", type = int, default = 1000)
+    parser.add_argument("-o", help = "Output file name")
+    parser.add_argument("--npy", help = "Prefix of binary output files. The MCMC state of each tree is written to prefix_states.npy " +
+                                    "and the date of the first increase in each tree, or NaN if there is none, to prefix_increase_dates.npy. " +
+                                    "These can be loaded with numpy.load. A description is written to prefix_metadata.json", default = None)
+    beast_runs.addRunArguments(parser)
+    checkpoint.addCheckpointArguments(parser)
+    run_stats.addStatsArguments(parser)
+    args = parser.parse_args()
+
+    runs = beast_runs.getRuns(args, parser)
+    if args.checkpoint and len(runs) > 1:
+        parser.error("--checkpoint can only be used with a single run")
+
+    stats = run_stats.RunStats(args)
+
+    if len(runs) == 1:
+        runs[0]["message"] = "Analysing tree"
+        results = [analyseRun(runs[0], args, {"o": args.o, "npy": args.npy}, stats)]
+    else:
+        #Analyse each run in a separate process, writing to part files that are merged once every run is complete
+        partDirectory = beast_runs.createPartDirectory(args.o)
+        try:
+            partOutputs = []
+            for run in runs:
+                run["message"] = "Run " + str(run["number"]) + " analysing tree"
+                partOutputs.append({"o": beast_runs.getPartName(partDirectory, run, "increase.txt"),
+                                    "npy": beast_runs.getPartName(partDirectory, run, "increase") if args.npy else None})
+
+            results = beast_runs.analyseRuns(analyseRun, runs, args, partOutputs, stats)
+
+            with stats.stage("output"):
+                mergeRuns(runs, results, args, partOutputs)
+        finally:
+            beast_runs.removePartDirectory(partDirectory)
+
+        #Report each run separately so the runs can be compared
+        for run, result in zip(runs, results):
+            print("Run " + str(run["number"]) + " (" + run["trees"] + "): " + str(result["trees"]) + " trees analysed after " +
+                  str(run["burnin"]) + "% burn-in, proportion with an inferred increase: " +
+                  str(float(result["increases"])/float(result["trees"])))
+
+    j = sum([r["trees"] for r in results])
+    k = sum([r["increases"] for r in results])
     
     print("Proportion of trees with an inferred increase in relative genetic diversity of " +
         args.p + "% above baseline (0.0 is none, 1.0 is all trees): " + str(float(k)/float(j)))
-    
-    outFile.close()
\ No newline at end of file
+
+    if args.npy:
+        files = {"states": args.npy + "_states.npy",
+                 "increase_dates": args.npy + "_increase_dates.npy"}
+        description = {"states": "MCMC state of each tree",
+                       "increase_dates": "Date of the first increase in relative genetic diversity above baseline in each tree, " +
+                                         "NaN if there is none"}
+        if len(runs) > 1:
+            files["runs"] = args.npy + "_runs.npy"
+            description["runs"] = "Run number of each tree, in the order of -t/-l"
+        column_output.writeMetadata(args.npy + "_metadata.json",
+                                    {"script": "population_increase_distribution_BEAST.py",
+                                     "runs": [{"trees_file": r["trees"], "log_file": r["log"], "burnin": r["burnin"]} for r in runs],
+                                     "latest_sample_date": float(args.d),
+                                     "percentage": float(args.p),
+                                     "trees": j,
+                                     "files": files,
+                                     "description": description})
+
+    stats.finish()
@@ -0,0 +1,262 @@
+#Summaries of posterior distributions used by the BEAST scripts
+#Summaries are updated one value at a time so they can be calculated in a single pass through the posterior and reported at any point,
+#allowing summaries to be updated while a BEAST analysis is running
+#Two methods are available: exact keeps every value, sketch keeps counts of values in logarithmically sized bins so memory use is
+#bounded regardless of the number of values while quantiles are accurate to within a given relative error
+
+import math
+from array import array
+
+import numpy as np
+
+#Returns the given quantile of a sorted list of values, interpolating linearly between values
+def getQuantile(sortedValues, q):
+    n = len(sortedValues)
+    if n == 0:
+        return(None)
+
+    position = q * (n - 1)
+    lower = int(math.floor(position))
+    upper = min(lower + 1, n - 1)
+
+    return(sortedValues[lower] + (sortedValues[upper] - sortedValues[lower]) * (position - lower))
+
+#Returns the shortest interval that contains the given proportion of a sorted list of values
+def getHPD(sortedValues, mass = 0.95):
+    n = len(sortedValues)
+    if n == 0:
+        return((None, None))
+
+    #Number of values within the interval
+    intervalSize = max(int(round(mass * n)), 1)
+
+    start = min(range(n - intervalSize + 1), key = lambda i: sortedValues[i + intervalSize - 1] - sortedValues[i])
+
+    return((sortedValues[start], sortedValues[start + intervalSize - 1]))
+
+#Formats a number for a summary table, None is written as NA
+def formatValue(value):
+    if value is None:
+        return("NA")
+
+    return(str(value))
+
+#Counts values in logarithmically sized bins so that any quantile can be estimated to within a relative error of accuracy
+#Negative values are binned by their magnitude and zeros are counted separately
+#If the number of bins exceeds maxBins, the bins closest to zero are merged, reducing the accuracy of only the smallest magnitudes
+class QuantileSketch:
+    def __init__(self, accuracy = 0.01, maxBins = 2048):
+        self.gamma = (1.0 + accuracy)/(1.0 - accuracy)
+        self.logGamma = math.log(self.gamma)
+        self.maxBins = maxBins
+        #Bin index to count for positive values and for the magnitude of negative values
+        self.positive = dict()
+        self.negative = dict()
+        self.zeros = 0
+        self.count = 0
+
+    #Returns the index of the bin containing a positive value
+    def getBin(self, value):
+        return(int(math.ceil(math.log(value)/self.logGamma)))
+
+    #Returns the value representing a bin, which is within the relative accuracy of every value in the bin
+    def getBinValue(self, index):
+        return(2.0 * (self.gamma ** index)/(self.gamma + 1.0))
+
+    #Merges the bins closest to zero until there are at most maxBins bins
+    def collapse(self, bins):
+        while len(bins) > self.maxBins:
+            indices = sorted(bins)
+            bins[indices[1]] += bins.pop(indices[0])
+
+    def add(self, value):
+        self.count += 1
+        if value > 0:
+            index = self.getBin(value)
+            self.positive[index] = self.positive.get(index, 0) + 1
+            if len(self.positive) > self.maxBins:
+                self.collapse(self.positive)
+        elif value < 0:
+            index = self.getBin(-value)
+            self.negative[index] = self.negative.get(index, 0) + 1
+            if len(self.negative) > self.maxBins:
+                self.collapse(self.negative)
+        else:
+            self.zeros += 1
+
+    #Adds the counts from another sketch with the same accuracy
+    def merge(self, other):
+        for bins, otherBins in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for index, count in otherBins.items():
+                bins[index] = bins.get(index, 0) + count
+            self.collapse(bins)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    #Returns the (value, count) of each bin in increasing order of value
+    def getBins(self):
+        bins = [(-self.getBinValue(i), self.negative[i]) for i in sorted(self.negative, reverse = True)]
+        if self.zeros:
+            bins.append((0.0, self.zeros))
+        bins.extend([(self.getBinValue(i), self.positive[i]) for i in sorted(self.positive)])
+
+        return(bins)
+
+    #Returns the estimated value at the given quantile
+    #As with getQuantile, the quantile is interpolated linearly between the values at the ranks either side of q * (count - 1)
+    def quantile(self, q):
+        if self.count == 0:
+            return(None)
+
+        position = q * (self.count - 1)
+        lower = int(math.floor(position))
+        upper = min(lower + 1, self.count - 1)
+
+        #Values of the bins containing the lower and upper ranks, counting from 0
+        lowerValue = None
+        cumulative = 0
+        for value, count in self.getBins():
+            cumulative += count
+            if lowerValue is None and cumulative > lower:
+                lowerValue = value
+            if cumulative > upper:
+                return(lowerValue + (value - lowerValue) * (position - lower))
+
+        return(value)
+
+    #Returns the shortest interval between bins that contains at least the given proportion of the values
+    #This does not have the relative accuracy of quantile. The interval lengths compared are only known to within the width of the bins
+    #at their upper end, so the chosen endpoints can be off by about accuracy multiplied by the upper end of the interval
+    def hpd(self, mass = 0.95):
+        if self.count == 0:
+            return((None, None))
+
+        bins = self.getBins()
+        intervalSize = max(int(round(mass * self.count)), 1)
+
+        best = None
+        end = 0
+        inInterval = 0
+        #Extend the end of the interval until it contains enough values, then record it and move the start along
+        for start in range(len(bins)):
+            while end < len(bins) and inInterval < intervalSize:
+                inInterval += bins[end][1]
+                end += 1
+            if inInterval < intervalSize:
+                break
+            if best is None or bins[end - 1][0] - bins[start][0] < best[1] - best[0]:
+                best = (bins[start][0], bins[end - 1][0])
+            inInterval -= bins[start][1]
+
+        return(best)
+
+#Collects the values of a single quantity across the posterior
+#method is either exact or sketch, accuracy is the relative accuracy of the sketch
+class ValueSummary:
+    def __init__(self, method = "exact", accuracy = 0.01):
+        self.method = method
+        self.count = 0
+        self.total = 0.0
+
+        if method == "exact":
+            #Values are stored as 8 byte doubles rather than a list of float objects, which use about 4 times the memory
+            self.values = array("d")
+            #Values are appended and only sorted when a summary is needed
+            self.isSorted = True
+        elif method == "sketch":
+            self.sketch = QuantileSketch(accuracy)
+        else:
+            raise ValueError("Summary method must be exact or sketch, not " + str(method))
+
+    def add(self, value):
+        value = float(value)
+        self.count += 1
+        self.total += value
+
+        if self.method == "exact":
+            if self.values and value < self.values[-1]:
+                self.isSorted = False
+            self.values.append(value)
+        else:
+            self.sketch.add(value)
+
+    #Adds the values from another summary with the same method
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+
+        if self.method == "exact":
+            self.values.extend(other.values)
+            self.isSorted = False
+        else:
+            self.sketch.merge(other.sketch)
+
+    #Returns the sorted values with the exact method
+    def getSorted(self):
+        if not self.isSorted:
+            #Sort the values in place through a numpy view of the array
+            np.frombuffer(self.values, dtype = np.float64).sort()
+            self.isSorted = True
+
+        return(self.values)
+
+    def mean(self):
+        if self.count == 0:
+            return(None)
+
+        return(self.total/float(self.count))
+
+    def quantile(self, q):
+        if self.method == "exact":
+            return(getQuantile(self.getSorted(), q))
+
+        return(self.sketch.quantile(q))
+
+    def hpd(self, mass = 0.95):
+        if self.method == "exact":
+            return(getHPD(self.getSorted(), mass))
+
+        return(self.sketch.hpd(mass))
+
+    #Returns the number of values, median and HPD interval
+    def summary(self, mass = 0.95):
+        lower, upper = self.hpd(mass)
+
+        return(self.count, self.quantile(0.5), lower, upper)
+
+#Collects the relative genetic diversity in each skyline window across the posterior
+#quantiles is a list of additional quantiles to be reported and mass is the proportion of values in the HPD interval
+class WindowSummary:
+    def __init__(self, intervals, method = "exact", accuracy = 0.01, quantiles = [0.025, 0.975], mass = 0.95):
+        self.intervals = intervals
+        self.windows = [ValueSummary(method, accuracy) for i in intervals]
+        self.quantiles = quantiles
+        self.mass = mass
+        self.trees = 0
+
+    #Adds the relative genetic diversity in each window for a single tree
+    #Windows that are not spanned by the tree have a value of "0" and are not included in that window's summary
+    def add(self, populationSize):
+        self.trees += 1
+        for window, value in zip(self.windows, populationSize):
+            if value != "0":
+                window.add(value)
+
+    #Adds the windows from another summary with the same windows, e.g. from another run
+    def merge(self, other):
+        self.trees += other.trees
+        for window, otherWindow in zip(self.windows, other.windows):
+            window.merge(otherWindow)
+
+    #Returns the summary as tab separated text with one row per window
+    def table(self):
+        hpdName = "HPD" + str(int(round(self.mass * 100)))
+        lines = ["\t".join(["Window_start", "Window_end", "Trees", "Mean", "Median", hpdName + "_lower", hpdName + "_upper"] +
+                           ["Quantile_" + str(q) for q in self.quantiles]) + "\n"]
+
+        for interval, window in zip(self.intervals, self.windows):
+            count, median, lower, upper = window.summary(self.mass)
+            row = [interval[0], interval[1], count, window.mean(), median, lower, upper] + [window.quantile(q) for q in self.quantiles]
+            lines.append("\t".join([formatValue(v) for v in row]) + "\n")
+
+        return("".join(lines))
@@ -0,0 +1,318 @@
+#Prunes every tree in a BEAST .trees file to a subset of tips, the equivalent of extract_subsample_tree.R for a whole posterior
+#The trees are read and written one at a time so the posterior does not need to fit in memory
+#Tips are given as names, which are converted to the numbers used in the trees through the Translate block
+#Internal nodes left with a single descendant are removed and their branch length is added to the branch of their descendant, as with
+#ape::keep.tip. Annotations on the remaining nodes and branches are kept
+#The taxa and Translate blocks of the output only contain the tips that are kept. Files containing one newick tree per line are also accepted
+#Use --threads to prune chunks of trees in parallel, the trees are written in their original order
+#To run:
+#python3 prune_posterior_trees.py -t BEAST.trees -n tips.txt -o BEAST_pruned.trees
+
+import argparse
+import multiprocessing
+import re
+
+#Splits a newick string into brackets, commas, colons, semicolons, [] comments, quoted labels and other text
+newickTokens = re.compile(r"\[[^\]]*\]|'[^']*'|[(),:;]|[^()\[\],:;']+")
+#Comments within a label or branch length
+comments = re.compile(r"\[[^\]]*\]")
+
+#Removes comments and quotes from a tip label
+def getTipName(label):
+    return(comments.sub("", label).strip().strip("'\""))
+
+#Reads the tips to be kept, 1 per line with no header as in extract_subsample_tree.R
+def readTips(tipsFile):
+    with open(tipsFile) as fileobject:
+        return([line.strip().strip("'\"") for line in fileobject if line.strip()])
+
+#Splits a trees file into its header lines, the position of the first tree and the Translate block
+#translate maps the labels used in the trees to tip names and is empty if the file has no Translate block
+def readTreesHeader(treesFile):
+    header = []
+    translate = dict()
+    inTranslate = False
+
+    with open(treesFile) as fileobject:
+        for line in fileobject:
+            if line.strip()[0:4].lower() == "tree" or line.strip()[0:1] == "(":
+                break
+            header.append(line)
+
+            if line.strip().lower() == "translate":
+                inTranslate = True
+            elif inTranslate:
+                entry = line.strip().rstrip(",;").strip()
+                if entry:
+                    key, name = entry.split(None, 1)
+                    translate[key] = name.strip("'\"")
+                if line.strip().endswith(";"):
+                    inTranslate = False
+
+    return(header, translate)
+
+#Rewrites the header of a trees file to only include the kept tips in the taxa and Translate blocks
+def pruneHeader(header, keepNames):
+    lines = []
+    block = None
+    translateLines = []
+
+    for line in header:
+        stripped = line.strip()
+
+        if stripped.lower() == "taxlabels":
+            block = "taxlabels"
+        elif stripped.lower() == "translate":
+            lines.append(line)
+            block = "translate"
+            continue
+        elif re.match(r"dimensions\s+ntax\s*=", stripped, re.IGNORECASE):
+            line = re.sub(r"ntax\s*=\s*\d+", "ntax=" + str(len(keepNames)), line, flags = re.IGNORECASE)
+        elif block == "taxlabels":
+            if stripped == ";":
+                block = None
+            elif stripped.strip("'\"") not in keepNames:
+                continue
+        elif block == "translate":
+            entry = stripped.rstrip(",;").strip()
+            if entry and entry.split(None, 1)[1].strip("'\"") in keepNames:
+                translateLines.append(line[:len(line) - len(line.lstrip())] + entry)
+            if stripped.endswith(";"):
+                #Write the kept entries with a comma after every entry other than the last
+                for i, entry in enumerate(translateLines):
+                    lines.append(entry + ("," if i < len(translateLines) - 1 else "") + "\n")
+                if stripped != ";":
+                    lines.append(line[:len(line) - len(line.lstrip())] + ";\n")
+                else:
+                    lines.append(line)
+                block = None
+            continue
+
+        lines.append(line)
+
+    return(lines)
+
+#Returns the numeric part of a branch length, 0 if there is none
+def getLength(length):
+    length = comments.sub("", length).strip()
+
+    return(float(length) if length else 0.0)
+
+#Formats a branch length that is the sum of other branch lengths, removing rounding errors from the sum, e.g. 5.8462000000000005
+def formatLength(length):
+    return(repr(float("%.15g" % length)))
+
+#Prunes a newick tree to the tips whose labels are in keepLabels
+#The tree is parsed into lists of children, labels and branch lengths in a single pass, pruned in a single pass from the tips to the root
+#and written in a single pass from the root to the tips, so the time taken is linear in the size of the tree
+#Returns the pruned newick string, None if no tips are kept
+def pruneNewick(newick, keepLabels):
+    children = []
+    labels = []
+    lengths = []
+
+    #Internal nodes that have been opened but not closed
+    openNodes = []
+    #The node whose label or branch length is being read, and whether the branch length is being read
+    current = None
+    inLength = False
+
+    for token in newickTokens.findall(newick):
+        if token == "(":
+            node = len(children)
+            children.append([])
+            labels.append("")
+            lengths.append(None)
+            if openNodes:
+                children[openNodes[-1]].append(node)
+            openNodes.append(node)
+            current = None
+            inLength = False
+        elif token == ",":
+            current = None
+            inLength = False
+        elif token == ")":
+            current = openNodes.pop()
+            inLength = False
+        elif token == ":":
+            inLength = True
+            lengths[current] = ""
+        elif token == ";":
+            break
+        elif current is None:
+            if token.isspace():
+                continue
+            #A tip
+            current = len(children)
+            children.append(None)
+            labels.append(token)
+            lengths.append(None)
+            if openNodes:
+                children[openNodes[-1]].append(current)
+        elif inLength:
+            lengths[current] += token
+        else:
+            labels[current] += token
+
+    if not children:
+        return(None)
+
+    #The node each node is replaced with after pruning, None if it has no kept tips
+    replacement = [None] * len(children)
+    #Branch length added to each node from removed nodes with a single descendant
+    addedLength = [0.0] * len(children)
+    merged = [False] * len(children)
+    #Kept children of each node
+    keptChildren = [None] * len(children)
+
+    #Nodes are numbered in the order they were opened, so every node is visited after its descendants when visited in reverse
+    for node in range(len(children) - 1, -1, -1):
+        if children[node] is None:
+            if getTipName(labels[node]) in keepLabels:
+                replacement[node] = node
+            continue
+
+        kept = [replacement[c] for c in children[node] if replacement[c] is not None]
+        if len(kept) == 1:
+            #Remove this node and add its branch length to its descendant
+            replacement[node] = kept[0]
+            if lengths[node] is not None:
+                addedLength[kept[0]] += getLength(lengths[node])
+                merged[kept[0]] = True
+                if lengths[kept[0]] is None:
+                    lengths[kept[0]] = ""
+        elif len(kept) > 1:
+            replacement[node] = node
+            keptChildren[node] = kept
+
+    root = replacement[0]
+    if root is None:
+        return(None)
+
+    #The branch above a new root is removed
+    if root != 0:
+        lengths[root] = None
+
+    #Write the tree, entries in the stack are either nodes or text to be written after the descendants of a node
+    output = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            output.append(node)
+            continue
+
+        end = labels[node]
+        if lengths[node] is not None:
+            if merged[node]:
+                lengthComments = "".join(comments.findall(lengths[node]))
+                end += ":" + lengthComments + formatLength(getLength(lengths[node]) + addedLength[node])
+            else:
+                end += ":" + lengths[node]
+
+        if keptChildren[node] is None:
+            output.append(end)
+        else:
+            output.append("(")
+            stack.append(")" + end)
+            for i in range(len(keptChildren[node]) - 1, -1, -1):
+                stack.append(keptChildren[node][i])
+                if i > 0:
+                    stack.append(",")
+
+    return("".join(output) + ";")
+
+#Prunes a tree line from a trees file, keeping the text before the newick tree, e.g. tree STATE_0 [&lnP=-1000.0] = [&R]
+def pruneTreeLine(line, keepLabels):
+    treeStart = line.find("(")
+    if treeStart == -1:
+        raise RuntimeError("Could not identify the tree in line " + line[:50])
+
+    #Annotations such as [&R] before the tree are kept with the text before the tree
+    prefix = line[:treeStart]
+    pruned = pruneNewick(line[treeStart:], keepLabels)
+    if pruned is None:
+        raise RuntimeError("None of the tips to be kept are in tree " + line[:50])
+
+    return(prefix + pruned + "\n")
+
+#Labels of the tips to be kept in each worker process
+workerKeepLabels = None
+
+def initialiseWorker(keepLabels):
+    global workerKeepLabels
+    workerKeepLabels = keepLabels
+
+def pruneChunk(lines):
+    return("".join([pruneTreeLine(line, workerKeepLabels) for line in lines]))
+
+#Yields lists of up to chunkSize tree lines from a trees file
+def getTreeChunks(treesFile, chunkSize):
+    chunk = []
+
+    with open(treesFile) as fileobject:
+        for line in fileobject:
+            if line.strip()[0:4].lower() == "tree" or line.strip()[0:1] == "(":
+                chunk.append(line.strip())
+                if len(chunk) == chunkSize:
+                    yield(chunk)
+                    chunk = []
+
+    if chunk:
+        yield(chunk)
+
+#Prunes the trees in chunks across worker processes and yields the pruned chunks in their original order
+#Only a few chunks per process are read ahead so memory use does not grow with the number of trees
+def pruneChunksParallel(chunks, keepLabels, threads):
+    pending = []
+
+    with multiprocessing.Pool(threads, initialiseWorker, (keepLabels,)) as pool:
+        for chunk in chunks:
+            pending.append(pool.apply_async(pruneChunk, (chunk,)))
+            if len(pending) >= threads * 2:
+                yield(pending.pop(0).get())
+
+        while pending:
+            yield(pending.pop(0).get())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", help = "Trees file from BEAST, or a file containing one newick tree per line", required = True)
+    parser.add_argument("-n", help = "Samples to be kept, text file with 1 sample per line and no header", required = True)
+    parser.add_argument("-o", help = "Output trees file containing the pruned trees", required = True)
+    parser.add_argument("--threads", help = "Number of processes used to prune the trees, default 1", type = int, default = 1)
+    parser.add_argument("--chunk_size", help = "Number of trees pruned by a process at a time with --threads, default 100", type = int,
+                        default = 100)
+    args = parser.parse_args()
+
+    tips = readTips(args.n)
+    header, translate = readTreesHeader(args.t)
+
+    #Convert the tip names into the labels used in the trees
+    if translate:
+        keepLabels = set([key for key, name in translate.items() if name in set(tips)])
+        keepNames = set([translate[key] for key in keepLabels])
+        missing = [tip for tip in tips if tip not in keepNames]
+        if missing:
+            print("Warning: " + str(len(missing)) + " samples are not in the Translate block of " + args.t + " and will not be in the " +
+                  "pruned trees, e.g. " + ", ".join(missing[:5]))
+    else:
+        keepLabels = set(tips)
+        keepNames = keepLabels
+
+    chunks = getTreeChunks(args.t, args.chunk_size)
+    if args.threads > 1:
+        prunedChunks = pruneChunksParallel(chunks, keepLabels, args.threads)
+    else:
+        prunedChunks = ("".join([pruneTreeLine(line, keepLabels) for line in chunk]) for chunk in chunks)
+
+    numberTrees = 0
+    with open(args.o, "w") as outFile:
+        outFile.write("".join(pruneHeader(header, keepNames)))
+        for prunedChunk in prunedChunks:
+            outFile.write(prunedChunk)
+            numberTrees += prunedChunk.count("\n")
+        if header:
+            outFile.write("End;\n")
+
+    print("Pruned " + str(numberTrees) + " trees to " + str(len(keepNames)) + " tips, written to " + args.o)
@@ -0,0 +1,188 @@
+#Calculates the correlation between root-to-tip distance and sampling date in a rooted tree and the significance of this
+#correlation using date permutations, without first exporting the distances from TempEst as with bootstrap_TempEst_rttd_date.R
+#Takes a rooted newick tree with the sampling date of each tip after the last _ in its name, or a csv file of tip names and dates
+#The root-to-tip distances are calculated in a single traversal of the tree. The dates are then randomly assigned to tips a given
+#number of times and R squared is calculated for all permutations at once from the correlation between each permuted date vector
+#and the root-to-tip distances. The proportion of permutations with R squared at least as high as with the real dates is the p-value
+#Use --clustered to permute the dates of clusters of tips sampled on the same date rather than individual tips
+#To run:
+#python3 root_to_tip_regression.py -t rooted_tree.nwk -b number_permutations
+
+from Bio import Phylo
+import pandas as pd
+import numpy as np
+import multiprocessing
+import argparse
+
+#Calculates the distance from the root to each tip in a single traversal of the tree
+#Returns a dictionary with tip names as keys and distances as values
+def getRootToTipDistances(tree):
+    distances = dict()
+
+    #Iterative rather than recursive so deep trees do not exceed the recursion limit
+    stack = [(tree.root, 0.0)]
+    while stack:
+        clade, distance = stack.pop()
+        if clade.clades:
+            for child in clade.clades:
+                stack.append((child, distance + (child.branch_length or 0.0)))
+        else:
+            distances[clade.name] = distance
+
+    return(distances)
+
+#Extracts the date after the last _ in each tip name
+#Returns a dictionary with tip names as keys and dates as values
+def getTreeDates(tipNames):
+    dates = dict()
+
+    for tip in tipNames:
+        try:
+            dates[tip] = float(tip.split("_")[-1])
+        except ValueError:
+            raise RuntimeError("Could not identify a date after the last _ in tip " + tip)
+
+    return(dates)
+
+#Imports dates from a csv file with tip names in the first column and dates in the second column
+def getCsvDates(datesFile):
+    tips = pd.read_csv(datesFile)
+
+    return(dict(zip(tips[tips.columns[0]], tips[tips.columns[1]].astype(float))))
+
+#Calculates the linear regression of root-to-tip distance on date
+#Returns R squared, the slope (substitution rate), the intercept and the date at which the line crosses a distance of 0
+#(the estimated root date)
+def getRegression(dates, distances):
+    dateDeviation = dates - dates.mean()
+    distanceDeviation = distances - distances.mean()
+
+    slope = (dateDeviation @ distanceDeviation)/(dateDeviation @ dateDeviation)
+    intercept = distances.mean() - slope * dates.mean()
+    rSquared = (dateDeviation @ distanceDeviation) ** 2/((dateDeviation @ dateDeviation) * (distanceDeviation @ distanceDeviation))
+    rootDate = -intercept/slope if slope != 0 else float("nan")
+
+    return(rSquared, slope, intercept, rootDate)
+
+#Calculates R squared for a matrix of permuted dates with one permutation per row
+#Permuting the dates of individual tips keeps the mean and variance of the real dates, so only the product of the deviations of each
+#permutation with the deviations of the distances changes. Permuting the dates of clusters of different sizes changes the mean and
+#variance of each permutation, so with clustered each row is centred on its own mean and divided by its own sum of squares
+def getPermutationRSquared(permutedDates, dates, distances, clustered = False):
+    distanceDeviation = distances - distances.mean()
+
+    if clustered:
+        dateDeviation = permutedDates - permutedDates.mean(axis = 1)[:, None]
+        dateSumSquares = np.einsum("ij,ij->i", dateDeviation, dateDeviation)
+    else:
+        dateDeviation = permutedDates - dates.mean()
+        dateSumSquares = (dates - dates.mean()) @ (dates - dates.mean())
+
+    return((dateDeviation @ distanceDeviation) ** 2/(dateSumSquares * (distanceDeviation @ distanceDeviation)))
+
+#Calculates R squared for a chunk of permutations and returns the number with R squared at least realRSquared and the sum of R squared
+#Each chunk has its own seed so the same permutations are carried out whether chunks are analysed in one or multiple processes
+#If clustered is True, the unique dates are permuted between the clusters of tips sharing each date
+def analysePermutationChunk(dates, distances, realRSquared, numberPermutations, clustered, seed):
+    rng = np.random.default_rng(seed)
+
+    if clustered:
+        clusterDates, clusters = np.unique(dates, return_inverse = True)
+    else:
+        clusterDates = dates
+
+    permutedDates = rng.permuted(np.tile(clusterDates, (numberPermutations, 1)), axis = 1)
+    if clustered:
+        #Assign each tip the permuted date of its cluster
+        permutedDates = permutedDates[:, clusters]
+
+    permutationRSquared = getPermutationRSquared(permutedDates, dates, distances, clustered)
+
+    #Allow for rounding errors so permutations that reproduce the real dates are counted
+    return(int(np.count_nonzero(permutationRSquared >= realRSquared * (1 - 1e-12))), float(permutationRSquared.sum()))
+
+#Dates and distances used by each worker process
+workerData = None
+
+def initialiseWorker(dates, distances, realRSquared, clustered):
+    global workerData
+    workerData = (dates, distances, realRSquared, clustered)
+
+def analysePermutationChunkWorker(numberPermutations, seed):
+    dates, distances, realRSquared, clustered = workerData
+
+    return(analysePermutationChunk(dates, distances, realRSquared, numberPermutations, clustered, seed))
+
+#Carries out the permutations in chunks of up to chunkSize permutations, so memory use does not grow with the number of permutations
+#Returns the number of permutations with R squared at least realRSquared and the mean R squared across permutations
+def permuteDates(dates, distances, realRSquared, permutations, chunkSize, clustered, seed, threads):
+    chunkSizes = [min(chunkSize, permutations - start) for start in range(0, permutations, chunkSize)]
+    chunkSeeds = np.random.SeedSequence(seed).spawn(len(chunkSizes))
+
+    if threads > 1:
+        with multiprocessing.Pool(threads, initialiseWorker, (dates, distances, realRSquared, clustered)) as pool:
+            results = pool.starmap(analysePermutationChunkWorker, zip(chunkSizes, chunkSeeds))
+    else:
+        results = [analysePermutationChunk(dates, distances, realRSquared, n, clustered, s) for n, s in zip(chunkSizes, chunkSeeds)]
+
+    numberHigher = sum([r[0] for r in results])
+    meanRSquared = sum([r[1] for r in results])/permutations
+
+    return(numberHigher, meanRSquared)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", help = "Rooted newick tree. Unless --dates is given, the sampling date of each tip needs to be after the " +
+                        "last _ in its name in decimal format (e.g. 2015.54)", required = True)
+    parser.add_argument("-b", help = "Number of date permutations, default 1000", type = int, default = 1000)
+    parser.add_argument("--dates", help = "csv file with tip names as they appear in the tree in the first column and their sampling " +
+                        "dates in decimal format in the second column. Used instead of dates in the tip names", default = None)
+    parser.add_argument("--clustered", help = "Permute dates between clusters of tips with the same sampling date rather than between " +
+                        "individual tips", action = "store_true", default = False)
+    parser.add_argument("--seed", help = "Seed for the random number generator, used to repeat the same permutations", type = int,
+                        default = None)
+    parser.add_argument("--chunk_size", help = "Number of permutations calculated at once, larger values are faster but use more " +
+                        "memory, default 1000", type = int, default = 1000)
+    parser.add_argument("--threads", help = "Number of processes used to carry out the permutations, default 1", type = int, default = 1)
+    parser.add_argument("-o", help = "Optional output file to which the date, root-to-tip distance and residual of each tip is " +
+                        "written. This has the same format as the TempEst Export Data file", default = None)
+    args = parser.parse_args()
+
+    if args.b < 1 or args.chunk_size < 1:
+        parser.error("-b and --chunk_size need to be at least 1")
+
+    #Import the tree and calculate root-to-tip distances
+    tree = Phylo.read(args.t, "newick")
+    tipDistances = getRootToTipDistances(tree)
+
+    if args.dates:
+        tipDates = getCsvDates(args.dates)
+    else:
+        tipDates = getTreeDates(tipDistances.keys())
+
+    missing = [tip for tip in tipDistances if tip not in tipDates]
+    if missing:
+        raise RuntimeError(str(len(missing)) + " tips do not have a date, e.g. " + missing[0])
+
+    tipNames = list(tipDistances.keys())
+    dates = np.array([tipDates[tip] for tip in tipNames], dtype = float)
+    distances = np.array([tipDistances[tip] for tip in tipNames], dtype = float)
+
+    #Calculate the correlation with the real dates
+    rSquared, slope, intercept, rootDate = getRegression(dates, distances)
+
+    if args.o:
+        with open(args.o, "w") as outFile:
+            outFile.write("tip\tdate\tdistance\tresidual\n")
+            for tip, date, distance in zip(tipNames, dates, distances):
+                outFile.write(tip + "\t" + str(date) + "\t" + str(distance) + "\t" + str(distance - (intercept + slope * date)) + "\n")
+
+    #Count the permutations with R squared at least as high as with the real dates
+    numberHigher, meanRSquared = permuteDates(dates, distances, rSquared, args.b, args.chunk_size, args.clustered, args.seed, args.threads)
+
+    print("Number of tips: " + str(len(tipNames)))
+    print("Rate (slope of root-to-tip distance against date): " + str(slope))
+    print("Root date (date at which root-to-tip distance is 0): " + str(rootDate))
+    print("Correlation between sampling date and root-to-tip distance with real dates (R squared): " + str(rSquared))
+    print("Mean R squared with permuted dates: " + str(meanRSquared))
+    print("Proportion of permutations with equal or greater correlation (p-value): " + str(float(numberHigher)/float(args.b)))
@@ -0,0 +1,140 @@
+#Run time statistics and profiling shared by the scripts in this repository
+#Use addStatsArguments to add --stats, --stats_json, --profile and --verbosity to a script's argument parser, then create a RunStats
+#with the parsed arguments, time each stage of the script with RunStats.stage and call RunStats.finish once the script is complete
+#Time spent in each stage is summed across all items, e.g. the "tree parse" stage is the total time spent parsing every tree
+
+from contextlib import contextmanager
+import cProfile
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    #resource is not available on Windows, peak memory will not be reported
+    resource = None
+
+#Adds the statistics, profiling and verbosity options to an argument parser
+def addStatsArguments(parser):
+    parser.add_argument("--stats", help = "Print the wall time of each stage, items processed per second and peak memory " +
+                        "once the script is complete", action = "store_true", default = False)
+    parser.add_argument("--stats_json", help = "Write the wall time of each stage, items processed per second and peak memory " +
+                        "to this json file", default = None)
+    parser.add_argument("--profile", help = "Profile the script with cProfile and write the profile to this file. The profile " +
+                        "can be viewed with python3 -m pstats profile_file", default = None)
+    parser.add_argument("--verbosity", help = "Amount of progress printed while running. 0 prints no progress, 1 prints an update " +
+                        "every nth tree set with -n, 2 also prints each MCMC state as it is analysed. Default 1", type = int,
+                        choices = [0, 1, 2], default = 1)
+
+#Returns the peak memory (RSS) in MB of this process, or of any child process it has waited for if larger, None if this is not available
+#Worker processes that have not been waited for are not included, so workers report their own peak memory to be merged
+def getPeakMemory():
+    if resource is None:
+        return(None)
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    #ru_maxrss is in bytes on macOS and KB elsewhere
+    if sys.platform == "darwin":
+        return(float(peak)/(1024.0 * 1024.0))
+
+    return(float(peak)/1024.0)
+
+#Collects the time spent in each stage of a script and the number of items processed
+class RunStats:
+    def __init__(self, args, itemName = "trees"):
+        self.args = args
+        self.itemName = itemName
+        #Total time in each stage, kept in the order the stages are first entered
+        self.stages = dict()
+        self.items = 0
+        #Largest peak memory reported by a worker process in MB
+        self.workerPeakMemory = None
+        self.start = time.perf_counter()
+
+        self.profiler = None
+        if getattr(args, "profile", None):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    #Times a block of code and adds the time to the given stage
+    @contextmanager
+    def stage(self, name):
+        stageStart = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - stageStart)
+
+    #Alternative to stage for long blocks of code, startStage returns a start time that is passed to endStage
+    def startStage(self):
+        return(time.perf_counter())
+
+    def endStage(self, name, stageStart):
+        self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - stageStart)
+
+    #Adds the stage times, items and peak memory from another process, e.g. a worker analysing one of multiple runs
+    #Stage times are summed so can be larger than the wall time when processes run in parallel
+    #The peak memory reported is the largest of any single process
+    def merge(self, stages, items, peakMemory = None):
+        for name, t in stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + t
+        self.items += items
+        if peakMemory is not None and (self.workerPeakMemory is None or peakMemory > self.workerPeakMemory):
+            self.workerPeakMemory = peakMemory
+
+    #Counts a processed item and prints progress at the requested verbosity
+    #j is the index of the item and n is the interval at which updates are printed
+    def progress(self, j, n, message):
+        self.items += 1
+        if getattr(self.args, "verbosity", 1) >= 1 and j % int(n) == 0:
+            print(message, j)
+
+    #Prints a message only if the verbosity is at least the given level
+    def log(self, level, message):
+        if getattr(self.args, "verbosity", 1) >= level:
+            print(message)
+
+    #Returns the collected statistics as a dictionary
+    def summary(self):
+        wallTime = time.perf_counter() - self.start
+        stages = {name: round(t, 6) for name, t in self.stages.items()}
+        #Time not within any stage, e.g. reading lines from the input files
+        #This is 0 when stage times from parallel processes add up to more than the wall time
+        stages["other"] = round(max(wallTime - sum(self.stages.values()), 0.0), 6)
+
+        peakMemory = getPeakMemory()
+        if self.workerPeakMemory is not None and (peakMemory is None or self.workerPeakMemory > peakMemory):
+            peakMemory = self.workerPeakMemory
+
+        return({"wall_seconds": round(wallTime, 6),
+                "stage_seconds": stages,
+                "items": self.items,
+                "item_name": self.itemName,
+                "items_per_second": round(float(self.items)/wallTime, 6) if wallTime > 0 else None,
+                "peak_memory_mb": round(peakMemory, 3) if peakMemory is not None else None})
+
+    #Stops the profiler and reports the statistics as requested in the arguments
+    def finish(self):
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.args.profile)
+
+        if not (getattr(self.args, "stats", False) or getattr(self.args, "stats_json", None)):
+            return
+
+        stats = self.summary()
+
+        if getattr(self.args, "stats", False):
+            print("Wall time: " + str(stats["wall_seconds"]) + " s")
+            for name, t in stats["stage_seconds"].items():
+                print("  " + name + ": " + str(t) + " s")
+            print(self.itemName.capitalize() + " processed: " + str(stats["items"]) + " (" + str(stats["items_per_second"]) + " " +
+                  self.itemName + "/s)")
+            if stats["peak_memory_mb"] is not None:
+                print("Peak memory: " + str(stats["peak_memory_mb"]) + " MB")
+
+        if getattr(self.args, "stats_json", None):
+            with open(self.args.stats_json, "w") as outStats:
+                json.dump(stats, outStats, indent = 1)
+                outStats.write("\n")
@@ -0,0 +1,169 @@
+#Builds and uses an index of the byte offset of each tree in a BEAST .trees file
+#The index is saved alongside the trees file as BEAST.trees.idx and is rebuilt automatically if the trees file changes
+#The index allows a subset of trees to be written as a NEXUS file by copying byte ranges from the trees file, so a posterior can be
+#split into subsets (e.g. trees supporting and not supporting a population change) by saving lists of states rather than copies of the trees
+#To build the index: python3 tree_index.py index -t BEAST.trees
+#To write a NEXUS file containing a subset of trees: python3 tree_index.py extract -t BEAST.trees -s states.txt -o subset.trees
+#The states file has one MCMC state per line in its first column, a header line and further tab separated columns are ignored,
+#so the _trees_supporting.tsv files written by population_change_support_BEAST.py --index can be used directly
+
+import os
+import re
+import argparse
+
+#Size of each read when copying trees
+copySize = 16 * 1024 * 1024
+
+#Returns the name of the index file for a trees file
+def getIndexName(treesFile):
+    return(treesFile + ".idx")
+
+#Extracts the MCMC state from a tree line, e.g. 1000 from tree STATE_1000 = ...
+def getTreeState(line):
+    if isinstance(line, bytes):
+        line = line.decode("latin1")
+
+    state = re.match(r"tree\s+STATE_(\S+?)[\s=\[]", line)
+    if not state:
+        raise RuntimeError("Could not identify the MCMC state of tree line " + line[:50])
+
+    return(state.group(1))
+
+#Reads through a trees file and identifies the length of the header and the state, byte offset and length of each tree
+#The header is everything before the first tree, i.e. the taxa and Translate blocks
+def buildIndex(treesFile):
+    headerLength = None
+    trees = []
+
+    offset = 0
+    with open(treesFile, "rb") as fileobject:
+        for line in fileobject:
+            if line[0:4] == b"tree":
+                if headerLength is None:
+                    headerLength = offset
+                trees.append((getTreeState(line), offset, len(line)))
+            offset += len(line)
+
+    if headerLength is None:
+        headerLength = offset
+
+    return({"header_length": headerLength, "trees": trees})
+
+#Writes an index to file along with the size and modification time of the trees file so it can be checked for changes
+def writeIndex(treesFile, index):
+    fileStats = os.stat(treesFile)
+
+    with open(getIndexName(treesFile), "w") as outIndex:
+        outIndex.write("#size\t" + str(fileStats.st_size) + "\n")
+        outIndex.write("#mtime_ns\t" + str(fileStats.st_mtime_ns) + "\n")
+        outIndex.write("#header_length\t" + str(index["header_length"]) + "\n")
+        outIndex.write("State\tOffset\tLength\n")
+        for state, offset, length in index["trees"]:
+            outIndex.write(state + "\t" + str(offset) + "\t" + str(length) + "\n")
+
+#Reads a saved index, returns None if there is no index or it was built from a different version of the trees file
+def readIndex(treesFile):
+    indexName = getIndexName(treesFile)
+    if not os.path.exists(indexName):
+        return(None)
+
+    fileStats = os.stat(treesFile)
+    index = {"trees": []}
+
+    with open(indexName) as fileobject:
+        fileInfo = dict()
+        for line in fileobject:
+            if line[0] == "#":
+                key, value = line[1:].strip().split("\t")
+                fileInfo[key] = int(value)
+            elif line[0:5] != "State":
+                state, offset, length = line.strip().split("\t")
+                index["trees"].append((state, int(offset), int(length)))
+
+    if fileInfo.get("size") != fileStats.st_size or fileInfo.get("mtime_ns") != fileStats.st_mtime_ns:
+        return(None)
+
+    index["header_length"] = fileInfo["header_length"]
+
+    return(index)
+
+#Returns the index of a trees file, building and saving it if there is no up to date index
+def getIndex(treesFile):
+    index = readIndex(treesFile)
+
+    if index is None:
+        index = buildIndex(treesFile)
+        writeIndex(treesFile, index)
+
+    return(index)
+
+#Returns a dictionary with states as keys and (byte offset, length) as values
+def getStateOffsets(index):
+    return({state: (offset, length) for state, offset, length in index["trees"]})
+
+#Reads MCMC states from the first column of a file, skipping a header line if present
+def readStates(statesFile):
+    states = []
+
+    with open(statesFile) as fileobject:
+        for line in fileobject:
+            state = line.strip().split("\t")[0]
+            if state and state != "State":
+                states.append(state)
+
+    return(states)
+
+#Copies byte ranges from one file to another, ranges that follow each other in the input are copied in a single read
+def copyRanges(inFile, outFile, ranges):
+    merged = []
+    for offset, length in ranges:
+        if merged and merged[-1][0] + merged[-1][1] == offset:
+            merged[-1][1] += length
+        else:
+            merged.append([offset, length])
+
+    for offset, length in merged:
+        inFile.seek(offset)
+        while length > 0:
+            data = inFile.read(min(length, copySize))
+            if not data:
+                raise RuntimeError("Trees file is shorter than expected from its index")
+            outFile.write(data)
+            length -= len(data)
+
+#Writes a NEXUS trees file containing the header of the trees file and the trees with the given states, in the given order
+def extractTrees(treesFile, states, outName, index = None):
+    if index is None:
+        index = getIndex(treesFile)
+    stateOffsets = getStateOffsets(index)
+
+    missing = [s for s in states if s not in stateOffsets]
+    if missing:
+        raise RuntimeError(str(len(missing)) + " states are not in " + treesFile + ", e.g. STATE_" + missing[0])
+
+    with open(treesFile, "rb") as inFile, open(outName, "wb") as outFile:
+        copyRanges(inFile, outFile, [(0, index["header_length"])] + [stateOffsets[s] for s in states])
+        outFile.write(b"End;")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    indexParser = subparsers.add_parser("index", help = "Build the index of a trees file")
+    indexParser.add_argument("-t", help = "The .trees file from BEAST", required = True)
+
+    extractParser = subparsers.add_parser("extract", help = "Write a NEXUS file containing a subset of trees from a trees file")
+    extractParser.add_argument("-t", help = "The .trees file from BEAST", required = True)
+    extractParser.add_argument("-s", help = "File containing the MCMC states of the trees to be extracted in its first column",
+                               required = True)
+    extractParser.add_argument("-o", help = "Output NEXUS trees file", required = True)
+    args = parser.parse_args()
+
+    if args.command == "index":
+        index = buildIndex(args.t)
+        writeIndex(args.t, index)
+        print("Indexed " + str(len(index["trees"])) + " trees, written to " + getIndexName(args.t))
+    else:
+        states = readStates(args.s)
+        extractTrees(args.t, states, args.o)
+        print("Written " + str(len(states)) + " trees to " + args.o)